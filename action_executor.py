@@ -0,0 +1,294 @@
+# action_executor.py
+import os
+import json
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from compress_extract import file_size, submit_compress_batch
+from file_crypto import encrypt_file, decrypt_file
+from file_transfer import device_of
+from action_planner import execute_plan
+from dedup import dedupe_file
+from image_similarity import keep_best_of_burst, NEAR_DUPLICATE_RADIUS
+from transcode import transcode_image
+
+ACTION_JOURNAL_FILE = 'action_journal.jsonl'
+IO_WORKERS_PER_DEVICE = 4
+IO_ACTIONS = ('move', 'copy', 'dedupe', 'keep_best')
+CPU_ACTIONS = ('compress', 'extract', 'encrypt', 'decrypt', 'chain', 'transcode')
+# Actions whose outputs land on fixed paths (or are skipped when present),
+# so one cut short by a crash can simply run again
+RERUNNABLE_ACTIONS = ('compress', 'extract', 'encrypt', 'decrypt')
+# One batch at a time per process, so a background resume never re-runs a
+# batch that is still executing or compacts the journal under it
+_batch_lock = threading.Lock()
+
+
+def _run_cpu_task(task):
+    """Run one CPU-bound action (top-level so the process pool can pickle it)"""
+    src = task['src']
+    if task['type'] == 'extract':
+        output_dir = task.get('target') or os.path.join(os.path.dirname(src), "Extracted")
+        # Members were judged from the listing in the parent; only those needed are written
+        from next_action import extract_members
+        result = extract_members(src, output_dir, task['decisions'])
+    elif task['type'] == 'encrypt':
+        result = encrypt_file(src)
+    elif task['type'] == 'decrypt':
+        result = decrypt_file(src)
+    elif task['type'] == 'chain':
+        result = execute_plan(src, task['steps'])
+    elif task['type'] == 'transcode':
+        result = transcode_image(src, task.get('format') or 'png', task.get('rule'))
+    else:
+        raise ValueError(f"Unsupported action type: {task['type']}")
+    if result is None:
+        raise RuntimeError(f"{task['type']} failed for {src}")
+    return result
+
+
+class ActionJournal:
+    """Append-only write-ahead log of action batches and completed tasks"""
+
+    def __init__(self, path=ACTION_JOURNAL_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def append(self, record):
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+    def read(self):
+        records = []
+        try:
+            with open(self.path, 'r') as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        break  # Torn final write from a crash
+        except FileNotFoundError:
+            pass
+        return records
+
+    def open_batches(self):
+        """Return {batch_id: (tasks, {task_id: done record}, {task_id: claimed path})} for uncommitted batches"""
+        batches = {}
+        for record in self.read():
+            if record['event'] == 'batch':
+                batches[record['batch']] = (record['tasks'], {}, {})
+            elif record['event'] == 'done' and record['batch'] in batches:
+                batches[record['batch']][1][record['task']] = record
+            elif record['event'] == 'claim' and record['batch'] in batches:
+                batches[record['batch']][2][record['task']] = record['dest']
+            elif record['event'] == 'commit':
+                batches.pop(record['batch'], None)
+        return batches
+
+    def compact(self):
+        """Drop the journal once every batch in it is committed"""
+        with self._lock:
+            if not self.open_batches():
+                open(self.path, 'w').close()
+
+
+class ActionExecutor:
+    """Runs queued actions in parallel: moves per destination device, CPU work in processes"""
+
+    def __init__(self, journal_path=ACTION_JOURNAL_FILE, io_workers=IO_WORKERS_PER_DEVICE, cpu_workers=None):
+        self.journal = ActionJournal(journal_path)
+        self.io_workers = io_workers
+        self.cpu_workers = cpu_workers or os.cpu_count() or 1
+        self._sorter = None
+        self._sorter_lock = threading.Lock()
+
+    @property
+    def sorter(self):
+        """Sorter for moves and copies; also decides archive members, so model calls stay in this process"""
+        with self._sorter_lock:
+            if self._sorter is None:
+                from next_action import ActionDecider
+                self._sorter = ActionDecider()
+            return self._sorter
+
+    @staticmethod
+    def _recover_claim(task):
+        """After a crash, (True, destination) if a move/copy already finished, else (False, None)
+
+        The claimed name is journaled before any byte is written, so a
+        placeholder or partial copy left behind is ours to remove.
+        """
+        claimed = task.get('claimed')
+        if not task.get('started'):
+            return False, None
+        if not os.path.exists(task['src']):
+            if task['type'] == 'move':
+                return True, claimed  # Moved before the interruption
+            raise FileNotFoundError(f"Source no longer exists: {task['src']}")
+        if not claimed or not os.path.exists(claimed):
+            return False, None
+        if task['type'] == 'copy' and os.path.getsize(claimed) == os.path.getsize(task['src']):
+            return True, claimed
+        os.remove(claimed)
+        print(f"[!] Removed unfinished {task['type']} destination {claimed}")
+        return False, None
+
+    def _run_io_task(self, batch_id, task):
+        if task['type'] in ('move', 'copy'):
+            finished, dest = self._recover_claim(task)
+            if finished:
+                return dest
+
+            def journal_claim(dest):
+                self.journal.append({'event': 'claim', 'batch': batch_id, 'task': task['id'], 'dest': dest})
+
+            if task['type'] == 'move':
+                return self.sorter.move_file(task['src'], task['target'], on_claim=journal_claim)
+            return self.sorter.copy_file(task['src'], task['target'], task.get('mode', 'copy'),
+                                         on_claim=journal_claim)
+        if task['type'] == 'dedupe':
+            return dedupe_file(task['src'], task['target'], task.get('mode', 'delete'))
+        return keep_best_of_burst(task['src'], task.get('radius') or NEAR_DUPLICATE_RADIUS)
+
+    def run(self, tasks, journaled=None):
+        """Journal and execute tasks; returns one result dict per task, in order
+
+        Each task is a dict with 'type', 'src' and optionally 'target', 'mode'
+        and 'queue'/'record' (re-queued there on failure). journaled() is called
+        once the batch is durable, which is when callers may clear their queue.
+        """
+        batch_id = uuid.uuid4().hex
+        tasks = [{**task, 'id': i} for i, task in enumerate(tasks)]
+        with _batch_lock:
+            self.journal.append({'event': 'batch', 'batch': batch_id, 'tasks': tasks})
+            if journaled:
+                journaled()
+            return self._execute(batch_id, tasks, {})
+
+    def resume(self):
+        """Finish any batch interrupted by a crash; returns its results"""
+        results = []
+        with _batch_lock:
+            for batch_id, (tasks, done, claims) in self.journal.open_batches().items():
+                remaining = len(tasks) - len(done)
+                print(f"[!] Resuming interrupted batch {batch_id[:8]}: {remaining}/{len(tasks)} actions left")
+                # Tasks may have run without their completion being journaled
+                tasks = [{**task, 'started': True, 'claimed': claims.get(task['id'])} for task in tasks]
+                results.extend(self._execute(batch_id, tasks, done))
+        return results
+
+    def _execute(self, batch_id, tasks, done):
+        results = {task_id: {'task': record['task'], 'ok': record['ok'],
+                             'result': record.get('result'), 'error': record.get('error')}
+                   for task_id, record in done.items()}
+        pending = [task for task in tasks if task['id'] not in done]
+
+        # Chains claim fresh output names and transcodes replace their source,
+        # so after a crash they go back to the user instead of running twice
+        for task in [task for task in pending if task.get('started') and task['type'] in CPU_ACTIONS
+                     and task['type'] not in RERUNNABLE_ACTIONS]:
+            pending.remove(task)
+            if os.path.exists(task['src']):
+                print(f"[!] {task['type']} of {task['src']} was interrupted; queued again for approval")
+                self._finish(batch_id, task, results, error="Interrupted; not re-run automatically")
+            else:
+                self._finish(batch_id, task, results, result=None)
+
+        # future -> its task, or the list of tasks a compress job covers
+        io_pools, futures = {}, {}
+        cpu_tasks = [task for task in pending if task['type'] in CPU_ACTIONS]
+        cpu_pool = ProcessPoolExecutor(max_workers=min(self.cpu_workers, len(cpu_tasks))) if cpu_tasks else None
+        try:
+            for task in pending:
+                if task['type'] in IO_ACTIONS:
+                    # keep_best works in place, so it has no target
+                    try:
+                        device = device_of(task.get('target') or task['src'])
+                    except Exception as e:
+                        print(f"[x] Failed to {task['type']} {task['src']}: {str(e)}")
+                        self._finish(batch_id, task, results, error=str(e))
+                        continue
+                    if device not in io_pools:
+                        io_pools[device] = ThreadPoolExecutor(max_workers=self.io_workers)
+                    futures[io_pools[device].submit(self._run_io_task, batch_id, task)] = task
+                elif task['type'] not in CPU_ACTIONS:
+                    self._finish(batch_id, task, results, error=f"Unsupported action type: {task['type']}")
+
+            # Largest files first so the batch doesn't end on one long job
+            cpu_tasks.sort(key=lambda task: file_size(task['src']), reverse=True)
+            compress_tasks = [task for task in cpu_tasks if task['type'] == 'compress']
+            jobs = [(task['src'], task.get('target') or os.path.join(os.path.dirname(task['src']), "Compressed"),
+                     bool(task.get('bundle'))) for task in compress_tasks]
+            for future, indices in submit_compress_batch(cpu_pool, jobs).items():
+                futures[future] = [compress_tasks[i] for i in indices]
+            for task in cpu_tasks:
+                if task['type'] == 'extract':
+                    # Decided here, where the model manager serializes and batches calls
+                    try:
+                        task = {**task, 'decisions': self.sorter.decide_archive(task['src'])}
+                    except Exception as e:
+                        print(f"[x] Failed to extract {task['src']}: {str(e)}")
+                        self._finish(batch_id, task, results, error=str(e))
+                        continue
+                if task['type'] != 'compress':
+                    futures[cpu_pool.submit(_run_cpu_task, task)] = task
+
+            for future in as_completed(futures):
+                if isinstance(futures[future], list):
+                    self._finish_compress(batch_id, futures[future], results, future)
+                    continue
+                task = futures[future]
+                try:
+                    self._finish(batch_id, task, results, result=future.result())
+                except Exception as e:
+                    print(f"[x] Failed to {task['type']} {task['src']}: {str(e)}")
+                    self._finish(batch_id, task, results, error=str(e))
+        finally:
+            for pool in io_pools.values():
+                pool.shutdown()
+            if cpu_pool:
+                cpu_pool.shutdown()
+
+        self._requeue([task for task in tasks if not results[task['id']]['ok']])
+        self.journal.append({'event': 'commit', 'batch': batch_id})
+        self.journal.compact()
+        return [results[task['id']] for task in tasks]
+
+    def _finish_compress(self, batch_id, group, results, future):
+        """Record a compress job's outcome for each file it covered"""
+        try:
+            archives = future.result()
+        except Exception as e:
+            archives = [None] * len(group)
+            print(f"[x] Compression job failed: {str(e)}")
+        for task, archive in zip(group, archives):
+            if archive is None:
+                self._finish(batch_id, task, results, error=f"compress failed for {task['src']}")
+            else:
+                self._finish(batch_id, task, results, result=archive)
+
+    def _finish(self, batch_id, task, results, result=None, error=None):
+        record = {'event': 'done', 'batch': batch_id, 'task': task['id'],
+                  'ok': error is None, 'result': result, 'error': error}
+        self.journal.append(record)
+        results[task['id']] = {'task': task['id'], 'ok': error is None, 'result': result, 'error': error}
+
+    @staticmethod
+    def _requeue(failed):
+        """Put failed actions back on the queue file they came from"""
+        by_queue = {}
+        for task in failed:
+            if task.get('queue'):
+                by_queue.setdefault(task['queue'], []).append(task.get('record', task['src']))
+        for queue, records in by_queue.items():
+            try:
+                with open(queue, 'r') as f:
+                    actions = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                actions = []
+            actions.extend(record for record in records if record not in actions)
+            with open(queue, 'w') as f:
+                json.dump(actions, f, indent=2)
@@ -0,0 +1,197 @@
+# action_planner.py
+import os
+import shutil
+import zipfile
+import tempfile
+from file_crypto import get_keyring, encrypt_stream
+from compress_extract import choose_codec, is_precompressed, SAMPLE_BLOCKS, SAMPLE_BLOCK_SIZE
+from file_transfer import device_of
+from name_allocator import get_name_allocator
+from encryption_index import get_encryption_index
+
+TRANSFORMS = ('compress', 'encrypt')
+PLACEMENTS = ('move', 'copy')
+# Compressed archives above this spill from memory to a temp file
+SPOOL_LIMIT = 64 * 1024 * 1024
+
+
+def _transfer_cost(size, src_dir, dest_dir):
+    """Bytes read/written to place a file: nothing for a same-device rename"""
+    if device_of(src_dir) == device_of(dest_dir):
+        return 0, 0
+    return size, size
+
+
+def _dest_dir(target):
+    """A placement target may name a directory or a file path"""
+    if target.endswith(('/', '\\')) or os.path.isdir(target) or not os.path.splitext(target)[1]:
+        return target
+    return os.path.dirname(target)
+
+
+class ActionPlan:
+    """Minimal-I/O execution plan for a chain of actions on one file
+
+    The steps are applied to a running artifact: compress turns the file into
+    <stem>.zip under Compressed/, encrypt into <name>.encrypted, and move/copy
+    place whatever the current artifact is. Instead of writing every
+    intermediate to disk, the source is read once and the final artifact is
+    written straight into its final directory.
+    """
+
+    def __init__(self, src, steps):
+        self.src = src
+        self.leading = []     # placements of the original before any transform
+        self.transforms = []  # (transform step, intermediate moves after it)
+        self.final = []       # placements of the final artifact
+
+        for step in steps:
+            if step['type'] in TRANSFORMS:
+                if self.transforms and self.final:
+                    if any(s['type'] == 'copy' for s in self.final):
+                        raise ValueError("Copying an intermediate artifact can't be fused")
+                    # Moving an intermediate is dropped; only where it ends up matters
+                    self.transforms[-1][1].extend(self.final)
+                    self.final = []
+                self.transforms.append((step, []))
+            elif step['type'] in PLACEMENTS:
+                (self.final if self.transforms else self.leading).append(step)
+            else:
+                raise ValueError(f"Unsupported step type in plan: {step['type']}")
+
+    def _output_path(self, src):
+        """Final artifact path, plus the directory each naive step would write to"""
+        directory, name = os.path.dirname(src), os.path.basename(src)
+        hops = []
+        for step, moves in self.transforms:
+            if step['type'] == 'compress':
+                directory = os.path.join(directory, "Compressed")
+                name = f"{os.path.splitext(name)[0]}.zip"
+            else:
+                name = f"{name}.encrypted"
+            hops.append(directory)
+            for move in moves:
+                directory = _dest_dir(move['target'])
+        moves = [step for step in self.final if step['type'] == 'move']
+        if moves:
+            directory = _dest_dir(moves[-1]['target'])
+        return os.path.join(directory, name), hops
+
+    @staticmethod
+    def _compress_into(source, out, name):
+        """Zip the stream source as member `name` into out"""
+        sample = b'' if is_precompressed(name) else source.read(SAMPLE_BLOCKS * SAMPLE_BLOCK_SIZE)
+        size = source.seek(0, os.SEEK_END)
+        source.seek(0)
+        _, method, level = choose_codec(name, sample)
+        with zipfile.ZipFile(out, 'w', method, compresslevel=level) as zipf:
+            with zipf.open(name, 'w', force_zip64=size >= zipfile.ZIP64_LIMIT) as member:
+                shutil.copyfileobj(source, member, 1024 * 1024)
+
+    def _run_transforms(self, src, dest):
+        """Stream src through the transforms into dest; returns each artifact's size
+
+        Only the first step reads from disk and only the last writes to it;
+        intermediate artifacts stay in memory unless they outgrow SPOOL_LIMIT.
+        """
+        kinds = [step['type'] for step, _ in self.transforms]
+        key = get_keyring().key if 'encrypt' in kinds else None
+        sizes, current = [], open(src, 'rb')
+        try:
+            for i, kind in enumerate(kinds):
+                last = i == len(kinds) - 1
+                out = open(dest, 'wb') if last else tempfile.SpooledTemporaryFile(max_size=SPOOL_LIMIT)
+                try:
+                    if kind == 'compress':
+                        self._compress_into(current, out, os.path.basename(src))
+                    else:
+                        encrypt_stream(current, out, key)
+                    sizes.append(out.tell())
+                except BaseException:
+                    out.close()
+                    raise
+                current.close()
+                current = out
+                current.seek(0)
+        finally:
+            current.close()
+        return sizes
+
+    def execute(self, sorter):
+        """Run the plan; returns the output path and bytes before/after fusion"""
+        src = self.src
+        naive = {'read': 0, 'written': 0}
+        optimized = {'read': 0, 'written': 0}
+
+        # Placements of the original cost the same either way
+        for step in self.leading:
+            size = os.path.getsize(src)
+            read, written = _transfer_cost(size, os.path.dirname(src), _dest_dir(step['target']))
+            if step['type'] == 'copy':
+                read, written = size, size
+            for totals in (naive, optimized):
+                totals['read'] += read
+                totals['written'] += written
+            if step['type'] == 'move':
+                src = sorter.move_file(src, step['target'])
+            else:
+                sorter.copy_file(src, step['target'], step.get('mode', 'copy'))
+
+        if not self.transforms:
+            return {'output': src, 'naive': naive, 'optimized': optimized}
+
+        source_size = os.path.getsize(src)
+        final_path, hops = self._output_path(src)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        allocator = get_name_allocator()
+        output = allocator.claim(final_path)
+        try:
+            sizes = self._run_transforms(src, output)
+        except Exception:
+            allocator.release(output)
+            raise
+        if self.transforms[-1][0]['type'] == 'encrypt':
+            get_encryption_index().track(output)
+
+        # What the step-by-step sequence would have read and written
+        in_size = source_size
+        for (step, moves), out_size, location in zip(self.transforms, sizes, hops):
+            naive['read'] += in_size
+            naive['written'] += out_size
+            for move in moves:
+                read, written = _transfer_cost(out_size, location, _dest_dir(move['target']))
+                naive['read'] += read
+                naive['written'] += written
+                location = _dest_dir(move['target'])
+            in_size = out_size
+        for step in self.final:
+            if step['type'] == 'copy':
+                read, written = in_size, in_size
+            else:
+                read, written = _transfer_cost(in_size, location, _dest_dir(step['target']))
+                location = _dest_dir(step['target'])
+            naive['read'] += read
+            naive['written'] += written
+
+        optimized['read'] += source_size
+        optimized['written'] += sizes[-1]
+        for step in self.final:
+            if step['type'] == 'copy':
+                sorter.copy_file(output, step['target'], step.get('mode', 'copy'))
+                optimized['read'] += sizes[-1]
+                optimized['written'] += sizes[-1]
+
+        steps = self.leading + [step for step, _ in self.transforms] + self.final
+        print(f"[✓] Planned {' -> '.join(step['type'] for step in steps)} "
+              f"for {os.path.basename(self.src)}: "
+              f"{naive['read'] + naive['written']} bytes of I/O before fusion, "
+              f"{optimized['read'] + optimized['written']} after")
+        return {'output': output, 'naive': naive, 'optimized': optimized}
+
+
+def execute_plan(src, steps, sorter=None):
+    """Build and run a fused plan for the pending steps of one file"""
+    if sorter is None:
+        from file_sorter import FileSorter
+        sorter = FileSorter()
+    return ActionPlan(src, steps).execute(sorter)
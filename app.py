@@ -2,6 +2,7 @@ import subprocess
 import sys
 import json
 import os
+import threading
 from datetime import datetime, timedelta
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QPushButton, QLabel, QCheckBox, 
@@ -12,12 +13,14 @@ from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QFont
 from PyQt5.QtCore import QFileSystemWatcher, QTimer, QPropertyAnimation, QEasingCurve
-from file_sorter import FileSorter
 from rule_creation import create_rule_from_natural_language
 import atexit
-from file_crypto import encrypt_file, decrypt_file
-from compress_extract import compress_file, extract_file
 from monitoring import load_processed_files
+from next_action import entry_task, entry_path
+from action_executor import ActionExecutor
+from transcode import report_savings
+from metadata_index import get_metadata_index
+from file_deleter import parse_schedule_entry
 
 class RuleEditorDialog(QDialog):
     def __init__(self, parent=None, rule=None):
@@ -221,12 +224,23 @@ class DigitalDeclutterAssistant(QMainWindow):
         self.debounce_timer.timeout.connect(self.reload_views)
         self.changed_files = set()
         
+        # Finish any action batch interrupted by a crash, without holding up the window
+        threading.Thread(target=self.resume_interrupted_actions, daemon=True).start()
+
         # Load rules
         self.load_rules()
         self.load_files_to_sort()
         self.load_files_to_delete()
 
         
+    @staticmethod
+    def resume_interrupted_actions():
+        """Failed actions are requeued to their files, which the watcher picks up"""
+        try:
+            ActionExecutor().resume()
+        except Exception as e:
+            print(f"[x] Failed to resume interrupted actions: {str(e)}")
+
     def handle_file_change(self, path):
         """Handle file change events with debouncing"""
         self.changed_files.add(path)
@@ -591,9 +605,11 @@ class DigitalDeclutterAssistant(QMainWindow):
                 processed = []
                 
             # Add new paths
+            known = set(processed)
             for path in new_paths:
-                if path and path not in processed:
+                if path and path not in known:
                     processed.append(path)
+                    known.add(path)
                     
             # Write back to file
             with open('processed_files.json', 'w') as f:
@@ -663,6 +679,9 @@ class DigitalDeclutterAssistant(QMainWindow):
             filename = os.path.basename(action['original_path'])
             filename_item = QTableWidgetItem(filename)
             filename_item.setForeground(Qt.white)
+            metadata = get_metadata_index().lookup(action['original_path'])
+            if metadata:
+                filename_item.setToolTip(f"{metadata['process_name']} - {metadata['window_title']}")
             self.sort_table.setItem(i, 2, filename_item)
             
             # Old path
@@ -671,122 +690,87 @@ class DigitalDeclutterAssistant(QMainWindow):
             self.sort_table.setItem(i, 3, old_path_item)
             
             # New path
-            new_path_item = QTableWidgetItem(action['target_path'])
+            new_path_item = QTableWidgetItem(action['target_path'] or "")
             new_path_item.setForeground(Qt.white)
             self.sort_table.setItem(i, 4, new_path_item)
         
-    def process_encrypt_actions(self):
-        """Process all pending encryption actions"""
+    def run_queued_actions(self, queue_file, action_type):
+        """Run every path queued in queue_file through the parallel executor"""
         try:
-            with open('encrypt_actions.json', 'r') as f:
+            with open(queue_file, 'r') as f:
                 actions = json.load(f)
         except (FileNotFoundError, json.JSONDecodeError):
-            QMessageBox.information(self, "Info", "No pending encrypt actions")
-            return
+            QMessageBox.information(self, "Info", f"No pending {action_type} actions")
+            return None
 
-        success = 0
-        for filepath in actions:
-            try:
-                encrypt_file(filepath)
-                success += 1
-            except Exception as e:
-                print(f"[x] Failed to encrypt {filepath}: {str(e)}")
+        def clear_queue():
+            # The journal now owns the batch, so a crash resumes from there
+            with open(queue_file, 'w') as f:
+                json.dump([], f, indent=2)
 
-        # Clear processed actions
-        with open('encrypt_actions.json', 'w') as f:
-            json.dump([], f, indent=2)
-            
+        # Failed actions go back on the queue file they came from
+        tasks = [{**entry_task(action_type, entry), 'queue': queue_file, 'record': entry} for entry in actions]
+        return ActionExecutor().run(tasks, journaled=clear_queue)
+
+    def process_encrypt_actions(self):
+        """Process all pending encryption actions"""
+        results = self.run_queued_actions('encrypt_actions.json', 'encrypt')
+        if results is None:
+            return
+
+        success = sum(1 for result in results if result['ok'])
         QMessageBox.information(self, "Complete", 
-            f"Encrypted {success}/{len(actions)} files successfully")
+            f"Encrypted {success}/{len(results)} files successfully")
         self.load_crypto_actions()
 
     def process_decrypt_actions(self):
         """Process all pending decryption actions"""
-        try:
-            with open('decrypt_actions.json', 'r') as f:
-                actions = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            QMessageBox.information(self, "Info", "No pending decrypt actions")
+        results = self.run_queued_actions('decrypt_actions.json', 'decrypt')
+        if results is None:
             return
 
-        success = 0
-        for filepath in actions:
-            try:
-                decrypt_file(filepath)
-                success += 1
-            except Exception as e:
-                print(f"[x] Failed to decrypt {filepath}: {str(e)}")
-
-        # Clear processed actions
-        with open('decrypt_actions.json', 'w') as f:
-            json.dump([], f, indent=2)
-            
+        success = sum(1 for result in results if result['ok'])
         QMessageBox.information(self, "Complete", 
-            f"Decrypted {success}/{len(actions)} files successfully")
+            f"Decrypted {success}/{len(results)} files successfully")
         self.load_crypto_actions()
 
     def process_compress_actions(self):
         """Process all pending compression actions"""
-        try:
-            with open('compress_actions.json', 'r') as f:
-                actions = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            QMessageBox.information(self, "Info", "No pending compress actions")
+        results = self.run_queued_actions('compress_actions.json', 'compress')
+        if results is None:
             return
 
-        success = 0
-        for filepath in actions:
-            try:
-                output_dir = os.path.join(os.path.dirname(filepath), "Compressed")
-                compress_file(filepath, output_dir)
-                success += 1
-            except Exception as e:
-                print(f"[x] Failed to compress {filepath}: {str(e)}")
-
-        # Clear processed actions
-        with open('compress_actions.json', 'w') as f:
-            json.dump([], f, indent=2)
-            
+        success = sum(1 for result in results if result['ok'])
         QMessageBox.information(self, "Complete", 
-            f"Compressed {success}/{len(actions)} files successfully")
+            f"Compressed {success}/{len(results)} files successfully")
         self.load_zip_actions()
 
     def process_extract_actions(self):
         """Process all pending extraction actions"""
-        try:
-            with open('extract_actions.json', 'r') as f:
-                actions = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            QMessageBox.information(self, "Info", "No pending extract actions")
+        results = self.run_queued_actions('extract_actions.json', 'extract')
+        if results is None:
             return
 
         success = 0
         processed_paths = []  # Track new paths
         
-        for filepath in actions:
-            try:
-                output_dir = os.path.join(os.path.dirname(filepath), "Extracted")
-                extracted_files = extract_file(filepath, output_dir)  # Should return list of extracted files
-                success += 1
-                
-                # Add extracted files to processed paths
-                if isinstance(extracted_files, list):
-                    processed_paths.extend(extracted_files)
-                elif extracted_files:  # Single path
-                    processed_paths.append(extracted_files)
-                    
-            except Exception as e:
-                print(f"[x] Failed to extract {filepath}: {str(e)}")
+        for result in results:
+            if not result['ok']:
+                continue
+            success += 1
+            extracted_files = result['result']
+            
+            # Add extracted files to processed paths
+            if isinstance(extracted_files, list):
+                processed_paths.extend(extracted_files)
+            elif extracted_files:  # Single path
+                processed_paths.append(extracted_files)
 
         # Update processed files list
         self.update_processed_files(processed_paths)
-        
-        # Clear processed actions
-        with open('extract_actions.json', 'w') as f:
-            json.dump([], f, indent=2)
             
         QMessageBox.information(self, "Complete", 
-            f"Extracted {success}/{len(actions)} files successfully")
+            f"Extracted {success}/{len(results)} files successfully")
         self.load_zip_actions()
 
 
@@ -812,14 +796,14 @@ class DigitalDeclutterAssistant(QMainWindow):
                   print(f"[x] Invalid JSON in {filename}: {str(e)}")
                   return files
 
-              for filepath, date_str in scheduled.items():
+              for filepath, entry in scheduled.items():
                   try:
                       # Validate path exists before processing
                       if not os.path.exists(filepath):
                           print(f"[!] Scheduled file missing: {filepath}")
                           continue
 
-                      deletion_date = datetime.fromisoformat(date_str)
+                      deletion_date, _ = parse_schedule_entry(entry)
                       delta = deletion_date - now
                       
                       if delta.total_seconds() > 0:
@@ -988,7 +972,8 @@ class DigitalDeclutterAssistant(QMainWindow):
         
         # Add compress actions
         row = 0
-        for filepath in compress_actions:
+        for entry in compress_actions:
+            filepath = entry_path(entry)
             self.zip_table.insertRow(row)
             
             # Checkbox
@@ -1009,6 +994,8 @@ class DigitalDeclutterAssistant(QMainWindow):
             
             # Destination
             dest_dir = os.path.join(os.path.dirname(filepath), "Compressed")
+            if isinstance(entry, dict) and entry.get('bundle'):
+                dest_dir = f"{dest_dir} (daily bundle)"
             dest_item = QTableWidgetItem(dest_dir)
             dest_item.setForeground(Qt.white)
             self.zip_table.setItem(row, 3, dest_item)
@@ -1188,23 +1175,28 @@ class DigitalDeclutterAssistant(QMainWindow):
               pending = json.load(f)
       except (FileNotFoundError, json.JSONDecodeError):
           return
-      
-      sorter = FileSorter()
-      failed_actions = []
-
-      for action in pending:
-          try:
-              if action['type'] == 'move':
-                  sorter.move_file(action['original_path'], action['target_path'])
-              elif action['type'] == 'copy':
-                  sorter.copy_file(action['original_path'], action['target_path'])
-          except Exception as e:
-              failed_actions.append(action)
-              print(f"[x] Failed to {action['type']} {action['original_path']}: {str(e)}")
-      
-      # Clear processed actions
-      with open('pending_actions.json', 'w') as f:
-          json.dump(failed_actions, f, indent=2)
+
+      tasks = [{
+          'type': action['type'],
+          'src': action['original_path'],
+          'target': action['target_path'],
+          'mode': action.get('mode', 'copy'),
+          'steps': action.get('steps', []),
+          'radius': action.get('radius'),
+          'format': action.get('format'),
+          'rule': action.get('rule'),
+          # Failed actions go back on the pending queue
+          'queue': 'pending_actions.json',
+          'record': action
+      } for action in pending]
+
+      def clear_pending():
+          with open('pending_actions.json', 'w') as f:
+              json.dump([], f, indent=2)
+
+      ActionExecutor().run(tasks, journaled=clear_pending)
+      if any(task['type'] == 'transcode' for task in tasks):
+          report_savings()
       
       self.load_files_to_sort()
 
@@ -0,0 +1,237 @@
+# bundle_archive.py
+import os
+import time
+import struct
+import sqlite3
+import zipfile
+from datetime import datetime, date
+from compress_extract import (
+    choose_codec, is_precompressed, read_sample, record_compression, load_compression_settings
+)
+
+BUNDLE_INDEX_DB = 'bundle_index.db'
+# Files of compress rules with "bundle": true go into bundles when below this size
+BUNDLE_BELOW = 1024 * 1024
+# A bundle is sealed and a new one started once it would grow past this
+BUNDLE_MAX_BYTES = 256 * 1024 * 1024
+
+
+def load_bundle_threshold():
+    """Bundle size cut-off, overridable as bundle_below in compression_profile.json (0 disables)"""
+    return load_compression_settings().get('bundle_below', BUNDLE_BELOW)
+
+
+class BundleIndex:
+    """Which bundle holds which file, so retrieval never scans archives
+
+    SQLite keeps it safe to update from several worker processes at once.
+    """
+
+    def __init__(self, db_path=BUNDLE_INDEX_DB):
+        self.db_path = db_path
+        with self._connect() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS bundles (
+                    archive TEXT PRIMARY KEY, folder TEXT, day TEXT, seq INTEGER,
+                    size INTEGER, sealed INTEGER DEFAULT 0
+                )""")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS bundle_members (
+                    source TEXT PRIMARY KEY, archive TEXT, arcname TEXT,
+                    size INTEGER, added TEXT
+                )""")
+            db.execute("CREATE INDEX IF NOT EXISTS idx_bundle_members_archive ON bundle_members(archive)")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def open_bundle(self, folder, day):
+        """The folder's unsealed bundle for day as (archive, size), starting one if needed"""
+        with self._connect() as db:
+            # Yesterday's bundles never grow again
+            db.execute("UPDATE bundles SET sealed = 1 WHERE folder = ? AND day != ? AND sealed = 0", (folder, day))
+            row = db.execute(
+                "SELECT archive, size FROM bundles WHERE folder = ? AND day = ? AND sealed = 0 "
+                "ORDER BY seq DESC LIMIT 1", (folder, day)
+            ).fetchone()
+            if row:
+                return row
+            seq = db.execute(
+                "SELECT COALESCE(MAX(seq), 0) + 1 FROM bundles WHERE folder = ? AND day = ?", (folder, day)
+            ).fetchone()[0]
+            archive = os.path.join(folder, f"bundle-{day}-{seq:03d}.zip")
+            db.execute("INSERT INTO bundles VALUES (?, ?, ?, ?, 0, 0)", (archive, folder, day, seq))
+            return archive, 0
+
+    def seal(self, archive):
+        with self._connect() as db:
+            db.execute("UPDATE bundles SET sealed = 1 WHERE archive = ?", (archive,))
+
+    def add_member(self, source, archive, arcname, size, archive_size):
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO bundle_members VALUES (?, ?, ?, ?, ?)",
+                (source, archive, arcname, size, datetime.now().isoformat())
+            )
+            db.execute("UPDATE bundles SET size = ? WHERE archive = ?", (archive_size, archive))
+
+    def lookup(self, source):
+        """(archive, arcname) holding source, or None"""
+        with self._connect() as db:
+            return db.execute(
+                "SELECT archive, arcname FROM bundle_members WHERE source = ?", (os.path.abspath(source),)
+            ).fetchone()
+
+    def keep_only(self, archive, arcnames):
+        """Forget members of archive that a rolled-back append never finished"""
+        size = os.path.getsize(archive) if os.path.exists(archive) else 0
+        with self._connect() as db:
+            rows = db.execute("SELECT source, arcname FROM bundle_members WHERE archive = ?", (archive,)).fetchall()
+            db.executemany("DELETE FROM bundle_members WHERE source = ?",
+                           [(source,) for source, arcname in rows if arcname not in arcnames])
+            db.execute("UPDATE bundles SET size = ? WHERE archive = ?", (size, archive))
+
+
+def _tail_path(archive):
+    return f"{archive}.tail"
+
+
+def _save_tail(archive):
+    """Set aside the central directory an append is about to overwrite
+
+    Appending writes new members over the old central directory, so a
+    crash half way would lose every member. The saved offset and tail
+    let _restore_tail put the archive back exactly as it was.
+    """
+    record = b''
+    if os.path.exists(archive):
+        with zipfile.ZipFile(archive, 'r') as zipf:
+            offset = zipf.start_dir
+        with open(archive, 'rb') as f:
+            f.seek(offset)
+            record = struct.pack('>Q', offset) + f.read()
+    with open(_tail_path(archive), 'wb') as f:
+        f.write(record)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _restore_tail(archive):
+    """Roll back an append that did not finish; returns True if one was undone"""
+    tail = _tail_path(archive)
+    if not os.path.exists(tail):
+        return False
+    with open(tail, 'rb') as f:
+        record = f.read()
+    if not record:
+        # The bundle did not exist before the append
+        if os.path.exists(archive):
+            os.remove(archive)
+    else:
+        offset = struct.unpack('>Q', record[:8])[0]
+        with open(archive, 'r+b') as f:
+            f.seek(offset)
+            f.write(record[8:])
+            f.truncate()
+    os.remove(tail)
+    print(f"[!] Rolled back an unfinished append to {archive}")
+    return True
+
+
+def _member_sizes(archive):
+    if not os.path.exists(archive):
+        return {}
+    with zipfile.ZipFile(archive, 'r') as zipf:
+        return {info.filename: info.file_size for info in zipf.infolist()}
+
+
+def _open_bundle(index, output_dir):
+    """Today's bundle, its size and {arcname: size}, after undoing any interrupted append"""
+    archive, archive_size = index.open_bundle(output_dir, date.today().isoformat())
+    if _restore_tail(archive):
+        members = _member_sizes(archive)
+        index.keep_only(archive, set(members))
+        archive_size = os.path.getsize(archive) if os.path.exists(archive) else 0
+    return archive, archive_size, _member_sizes(archive)
+
+
+def _unique_arcname(name, taken):
+    stem, ext = os.path.splitext(name)
+    candidate, counter = name, 1
+    while candidate in taken:
+        candidate = f"{stem} ({counter}){ext}"
+        counter += 1
+    return candidate
+
+
+def bundle_files(file_paths, output_dir, profile=None):
+    """Append files to output_dir's rolling bundle for today; one archive path (or None) per file
+
+    Members are appended, so existing ones are never rewritten. A bundle is
+    sealed once the next file would push it past BUNDLE_MAX_BYTES, and a new
+    one is started. A file already bundled with the same size is skipped,
+    so re-running an interrupted batch adds nothing twice, and an append
+    cut short by a crash is rolled back. Run one call per output folder at
+    a time.
+    """
+    output_dir = os.path.abspath(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    index = BundleIndex()
+    max_bytes = load_compression_settings().get('bundle_max_bytes', BUNDLE_MAX_BYTES)
+    archive, archive_size, members = _open_bundle(index, output_dir)
+
+    results = []
+    for file_path in file_paths:
+        try:
+            size = os.path.getsize(file_path)
+            location = index.lookup(file_path)
+            if location and _member_sizes(location[0]).get(location[1]) == size:
+                print(f"[!] {file_path} is already in {location[0]}")
+                results.append(location[0])
+                continue
+            if archive_size and archive_size + size > max_bytes:
+                index.seal(archive)
+                print(f"[✓] Sealed bundle {archive} at {archive_size / 1e6:.1f} MB")
+                archive, archive_size, members = _open_bundle(index, output_dir)
+
+            start = time.perf_counter()
+            name = os.path.basename(file_path)
+            sample = b'' if is_precompressed(name) else read_sample(file_path)
+            codec, method, level = choose_codec(name, sample, profile)
+            arcname = _unique_arcname(name, members)
+            before = os.path.getsize(archive) if os.path.exists(archive) else 0
+            _save_tail(archive)
+            try:
+                with zipfile.ZipFile(archive, 'a', method, compresslevel=level) as zipf:
+                    zipf.write(file_path, arcname=arcname)
+                archive_size = os.path.getsize(archive)
+                index.add_member(os.path.abspath(file_path), archive, arcname, size, archive_size)
+            except BaseException:
+                _restore_tail(archive)
+                index.keep_only(archive, set(members))
+                archive_size = before
+                raise
+            os.remove(_tail_path(archive))
+            members[arcname] = size
+            ratio, throughput = record_compression(
+                file_path, codec, size, archive_size - before, time.perf_counter() - start
+            )
+            print(f"[✓] Bundled {file_path} into {archive} ({codec}, {ratio:.0%} of original)")
+            results.append(archive)
+        except Exception as e:
+            print(f"[x] Bundling failed for {file_path}: {str(e)}")
+            results.append(None)
+    return results
+
+
+def retrieve_bundled(source, output_dir=None):
+    """Extract one bundled file by its original path; returns the extracted path"""
+    location = BundleIndex().lookup(source)
+    if location is None:
+        raise FileNotFoundError(f"{source} is not in any bundle")
+    archive, arcname = location
+    output_dir = output_dir or os.path.dirname(os.path.abspath(source))
+    with zipfile.ZipFile(archive, 'r') as zipf:
+        extracted = zipf.extract(arcname, output_dir)
+    print(f"[✓] Retrieved {arcname} from {archive}")
+    return extracted
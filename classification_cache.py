@@ -0,0 +1,69 @@
+# classification_cache.py
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+CLASSIFICATION_TTL = 15 * 60  # seconds
+MAX_CLASSIFICATIONS = 512
+
+
+class ClassificationCache:
+    """In-process memo of model answers, shared by speculative and real lookups
+
+    Entries are futures, so a file arriving while a speculative call for the
+    same window is still running waits for that call instead of repeating it.
+    """
+
+    def __init__(self, ttl=CLASSIFICATION_TTL, max_entries=MAX_CLASSIFICATIONS):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (created, future)
+        self._lock = threading.Lock()
+
+    def _claim(self, key):
+        """Return (future, owner); owner is True if the caller must compute it"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and not entry[1].cancelled() and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                return entry[1], False
+            future = Future()
+            future.set_running_or_notify_cancel()
+            self._entries[key] = (time.monotonic(), future)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return future, True
+
+    def _forget(self, key, future):
+        with self._lock:
+            if key in self._entries and self._entries[key][1] is future:
+                del self._entries[key]
+
+    def get_or_compute(self, key, compute):
+        """Return the cached answer for key, computing it once if needed"""
+        future, owner = self._claim(key)
+        if owner:
+            try:
+                future.set_result(compute())
+            except BaseException as e:
+                # Failures are not cached; the next lookup tries again
+                self._forget(key, future)
+                future.set_exception(e)
+        return future.result()
+
+    def contains(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return bool(entry) and time.monotonic() - entry[0] < self.ttl
+
+
+_cache = None
+
+
+def get_classification_cache():
+    """Process-wide cache shared by every FileSorter"""
+    global _cache
+    if _cache is None:
+        _cache = ClassificationCache()
+    return _cache
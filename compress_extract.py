@@ -1,9 +1,141 @@
 import zipfile
+import tarfile
 import os
+import json
+import math
+import time
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime
 from pathlib import Path
 
-def compress_file(file_path, output_dir):
-  """Compress file to ZIP archive"""
+COMPRESSION_PROFILE_FILE = 'compression_profile.json'
+COMPRESSION_STATS_FILE = 'compression_stats.jsonl'
+DEFAULT_PROFILE = 'balanced'
+# Formats that already carry their own compression
+INCOMPRESSIBLE_EXTENSIONS = {
+    'jpg', 'jpeg', 'png', 'gif', 'webp', 'heic', 'avif',
+    'mp3', 'aac', 'ogg', 'opus', 'flac', 'm4a',
+    'mp4', 'mkv', 'mov', 'avi', 'webm',
+    'zip', '7z', 'rar', 'gz', 'tgz', 'bz2', 'xz', 'zst', 'cab',
+    'docx', 'xlsx', 'pptx', 'odt', 'epub', 'jar', 'apk',
+    'encrypted',
+}
+SAMPLE_BLOCKS = 4
+SAMPLE_BLOCK_SIZE = 64 * 1024
+# Bits per byte: above STORE_ENTROPY deflate gains nothing, above
+# DENSE_ENTROPY it gains little enough that only a fast level is worth it
+STORE_ENTROPY = 7.5
+DENSE_ENTROPY = 6.5
+# Extraction refuses archives expanding past either limit (compression_profile.json
+# keys extract_max_bytes / extract_max_ratio) before inflating anything
+EXTRACT_MAX_BYTES = 8 * 1024 ** 3
+EXTRACT_MAX_RATIO = 200
+EXTRACT_CHUNK = 1024 * 1024
+EXTRACT_WORKERS = 4
+MAGIC_BYTES = 16
+# Leading bytes -> type, for judging archive members without extracting them
+MAGIC_SIGNATURES = [
+    (b'%PDF', 'pdf'), (b'\x89PNG\r\n\x1a\n', 'png'), (b'\xff\xd8\xff', 'jpg'), (b'GIF8', 'gif'),
+    (b'PK\x03\x04', 'zip'), (b'\x1f\x8b', 'gz'), (b'BZh', 'bz2'), (b'\xfd7zXZ\x00', 'xz'),
+    (b"7z\xbc\xaf'\x1c", '7z'), (b'Rar!', 'rar'), (b'MZ', 'exe'), (b'\x7fELF', 'elf'),
+    (b'ID3', 'mp3'), (b'OggS', 'ogg'), (b'\xd0\xcf\x11\xe0', 'ole'),
+]
+# ZIP_ZSTANDARD exists from Python 3.14 on
+ZIP_ZSTANDARD = getattr(zipfile, 'ZIP_ZSTANDARD', None)
+
+# profile -> (codec name, zipfile method, level) for compressible data. Only
+# deflate opens in Windows Explorer and older Pythons, so zstd is opt-in
+PROFILES = {
+    'fast': ('deflate-1', zipfile.ZIP_DEFLATED, 1),
+    'balanced': ('deflate-6', zipfile.ZIP_DEFLATED, 6),
+    'ratio': ('lzma', zipfile.ZIP_LZMA, None),
+}
+if ZIP_ZSTANDARD:
+    PROFILES['zstd'] = ('zstd-3', ZIP_ZSTANDARD, 3)
+
+
+def is_precompressed(name):
+    return os.path.splitext(name)[1][1:].lower() in INCOMPRESSIBLE_EXTENSIONS
+
+
+def load_compression_settings():
+    """Contents of compression_profile.json, or {} when it is missing"""
+    try:
+        with open(COMPRESSION_PROFILE_FILE, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def load_profile():
+    """Speed/ratio profile from compression_profile.json: fast, balanced, ratio or zstd (Python 3.14+)"""
+    profile = load_compression_settings().get('profile', DEFAULT_PROFILE)
+    return profile if profile in PROFILES else DEFAULT_PROFILE
+
+
+def read_sample(file_path):
+    """Up to SAMPLE_BLOCKS blocks spread over the file, not just its header"""
+    size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        if size <= SAMPLE_BLOCKS * SAMPLE_BLOCK_SIZE:
+            return f.read()
+        blocks = []
+        step = (size - SAMPLE_BLOCK_SIZE) // (SAMPLE_BLOCKS - 1)
+        for i in range(SAMPLE_BLOCKS):
+            f.seek(i * step)
+            blocks.append(f.read(SAMPLE_BLOCK_SIZE))
+        return b''.join(blocks)
+
+
+def entropy(sample):
+    """Shannon entropy of a byte sample in bits per byte (0-8)"""
+    if not sample:
+        return 0.0
+    total = len(sample)
+    return -sum(n / total * math.log2(n / total) for n in Counter(sample).values())
+
+
+def choose_codec(name, sample=b'', profile=None):
+    """Pick (codec name, zipfile method, level) for one member
+
+    Known compressed formats are stored without reading them; everything
+    else is judged by the entropy of its sample.
+    """
+    if is_precompressed(name):
+        return 'stored', zipfile.ZIP_STORED, None
+    bits = entropy(sample)
+    if bits >= STORE_ENTROPY:
+        return 'stored', zipfile.ZIP_STORED, None
+    if bits >= DENSE_ENTROPY:
+        return PROFILES['fast']
+    return PROFILES[profile or load_profile()]
+
+
+def record_compression(file_path, codec, original_size, compressed_size, seconds):
+    """Append one line per file so profiles can be tuned from real ratios"""
+    ratio = compressed_size / original_size if original_size else 1.0
+    throughput = original_size / seconds / 1e6 if seconds > 0 else 0.0
+    try:
+        with open(COMPRESSION_STATS_FILE, 'a') as f:
+            f.write(json.dumps({
+                't': datetime.now().isoformat(timespec='seconds'),
+                'file': file_path,
+                'ext': os.path.splitext(file_path)[1][1:].lower(),
+                'codec': codec,
+                'in': original_size,
+                'out': compressed_size,
+                'ratio': round(ratio, 4),
+                'mb_s': round(throughput, 2),
+            }, separators=(',', ':')) + '\n')
+    except Exception as e:
+        print(f"[x] Failed to record compression stats: {str(e)}")
+    return ratio, throughput
+
+
+def compress_file(file_path, output_dir, profile=None):
+  """Compress file to ZIP archive with a codec suited to its content"""
 
   try:
     output_dir = Path(output_dir)
@@ -12,29 +144,276 @@ def compress_file(file_path, output_dir):
     file_name = os.path.basename(file_path)
     zip_path = os.path.join(output_dir, f"{os.path.splitext(file_name)[0]}.zip")
 
-    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf: 
+    start = time.perf_counter()
+    sample = b'' if is_precompressed(file_name) else read_sample(file_path)
+    codec, method, level = choose_codec(file_name, sample, profile)
+
+    with zipfile.ZipFile(zip_path, 'w', method, compresslevel=level) as zipf:
       zipf.write(file_path, arcname=file_name)
 
-    print(f"[✓] Compressed {file_path} to {zip_path}")
+    ratio, throughput = record_compression(
+      file_path, codec, os.path.getsize(file_path), os.path.getsize(zip_path),
+      time.perf_counter() - start
+    )
+    print(f"[✓] Compressed {file_path} to {zip_path} ({codec}, {ratio:.0%} of original, {throughput:.1f} MB/s)")
     return str(zip_path)
   
   except Exception as e:
         print(f"[x] Compression failed: {str(e)}")
         return None
+
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _compress_one(file_path, output_dir, profile=None):
+    return [compress_file(file_path, output_dir, profile)]
+
+
+def submit_compress_batch(pool, jobs, profile=None):
+    """Submit (file_path, output_dir, bundle) jobs to a process pool, largest first
+
+    Returns {future: [indices into jobs]}; each future yields one archive
+    path (or None) per index. Small files whose rule asked for bundling
+    are grouped into one bundle job per output folder. Starting the biggest jobs first (longest-processing-
+    time order) lets the small ones fill the gaps at the end, instead of
+    one big file running alone after everything else.
+    """
+    from bundle_archive import bundle_files, load_bundle_threshold
+    bundle_below = load_bundle_threshold()
+    sizes = [file_size(file_path) for file_path, _, _ in jobs]
+
+    groups, bundles = [], {}
+    for i, (file_path, output_dir, bundle) in enumerate(jobs):
+        if bundle and sizes[i] < bundle_below:
+            bundles.setdefault(os.path.abspath(output_dir), []).append(i)
+        else:
+            groups.append((False, [i]))
+    groups.extend((True, indices) for indices in bundles.values())
+    groups.sort(key=lambda group: sum(sizes[i] for i in group[1]), reverse=True)
+
+    futures = {}
+    for bundled, indices in groups:
+        output_dir = jobs[indices[0]][1]
+        if bundled:
+            future = pool.submit(bundle_files, [jobs[i][0] for i in indices], output_dir, profile)
+        else:
+            future = pool.submit(_compress_one, jobs[indices[0]][0], output_dir, profile)
+        futures[future] = indices
+    return futures
+
+
+def compress_batch(files, output_dir=None, profile=None, workers=None, bundle=False):
+    """Compress files on all cores, yielding (file_path, zip_path) as each finishes
+
+    zip_path is None for a file that failed. Without output_dir each file
+    goes to a Compressed folder beside it. With bundle, small files are
+    appended to the folder's rolling bundle instead.
+    """
+    files = list(files)
+    if not files:
+        return
+    jobs = [(path, output_dir or os.path.join(os.path.dirname(path), "Compressed"), bundle) for path in files]
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = submit_compress_batch(pool, jobs, profile)
+        for future in as_completed(futures):
+            indices = futures[future]
+            try:
+                results = future.result()
+            except Exception as e:
+                print(f"[x] Compression failed: {str(e)}")
+                results = [None] * len(indices)
+            for i, result in zip(indices, results):
+                yield jobs[i][0], result
   
 
-def extract_file(zip_path, output_dir):
-    """Extract ZIP archive contents"""
+def sniff_type(header):
+    """Type named by a file's leading bytes, or '' when unrecognised"""
+    if header[:4] == b'RIFF' and header[8:12] in (b'WEBP', b'WAVE', b'AVI '):
+        return {b'WEBP': 'webp', b'WAVE': 'wav', b'AVI ': 'avi'}[header[8:12]]
+    if header[4:8] == b'ftyp':
+        return 'mp4'
+    for signature, kind in MAGIC_SIGNATURES:
+        if header.startswith(signature):
+            return kind
+    return ''
+
+
+def list_members(archive_path):
+    """Name, size and sniffed type of every file in an archive, without extracting
+
+    Zip sizes come from the central directory; only the first bytes of each
+    member are inflated to sniff its type. A member that cannot be read
+    (encrypted, corrupt or an unsupported method) is listed with magic None.
+    """
+    def sniff_member(name, read_header):
+        try:
+            return sniff_type(read_header())
+        except Exception as e:
+            print(f"[!] Cannot read {name} in {archive_path}: {str(e)}")
+            return None
+
+    def read_zip_header(zipf, info):
+        with zipf.open(info) as source:
+            return source.read(MAGIC_BYTES)
+
+    members = []
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path, 'r') as zipf:
+            for info in zipf.infolist():
+                if info.is_dir():
+                    continue
+                magic = sniff_member(info.filename, lambda: read_zip_header(zipf, info))
+                members.append({'name': info.filename, 'size': info.file_size, 'magic': magic})
+    elif tarfile.is_tarfile(archive_path):
+        with tarfile.open(archive_path, 'r|*') as tar:
+            for member in tar:
+                if member.isfile():
+                    magic = sniff_member(member.name, lambda: tar.extractfile(member).read(MAGIC_BYTES))
+                    members.append({'name': member.name, 'size': member.size, 'magic': magic})
+    else:
+        raise ValueError(f"Unsupported archive format: {archive_path}")
+    return members
+
+
+def member_path(output_dir, name):
+    """Where extract_file puts member `name`"""
+    return _safe_target(os.path.realpath(output_dir), name)
+
+
+class ExtractionLimitError(Exception):
+    """Archive would expand beyond the configured size or ratio limits"""
+
+
+def _extraction_limits():
+    settings = load_compression_settings()
+    return (settings.get('extract_max_bytes', EXTRACT_MAX_BYTES),
+            settings.get('extract_max_ratio', EXTRACT_MAX_RATIO))
+
+
+def _safe_target(output_dir, name):
+    """Resolve a member name inside output_dir, refusing absolute or ../ paths"""
+    target = os.path.realpath(os.path.join(output_dir, name))
+    if os.path.commonpath([output_dir, target]) != output_dir:
+        raise ValueError(f"Unsafe member path: {name}")
+    return target
+
+
+def _write_stream(source, target):
+    """Copy a member stream in fixed-size chunks, swapping it in when complete"""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    temp = f"{target}.part"
+    try:
+        with open(temp, 'wb') as out:
+            while True:
+                chunk = source.read(EXTRACT_CHUNK)
+                if not chunk:
+                    break
+                out.write(chunk)
+        os.replace(temp, target)
+    except BaseException:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+    return target
+
+
+def _check_limits(archive_path, total, max_bytes, max_ratio):
+    archive_size = max(os.path.getsize(archive_path), 1)
+    if total > max_bytes:
+        raise ExtractionLimitError(f"{archive_path} expands to {total / 1e6:.1f} MB (limit {max_bytes / 1e6:.1f} MB)")
+    if total / archive_size > max_ratio:
+        raise ExtractionLimitError(f"{archive_path} expands {total / archive_size:.0f}x (limit {max_ratio}x)")
+
+
+def _extract_zip(archive_path, output_dir, max_bytes, max_ratio, names=None):
+    with zipfile.ZipFile(archive_path, 'r') as zipf:
+        members = [info for info in zipf.infolist()
+                   if not info.is_dir() and (names is None or info.filename in names)]
+    # The central directory has every size, so nothing is inflated before the check
+    _check_limits(archive_path, sum(info.file_size for info in members), max_bytes, max_ratio)
+    # A repeated name keeps its last entry, as extractall would
+    targets = {_safe_target(output_dir, info.filename): info for info in members}
+
+    local, handles, produced = threading.local(), [], []
+
+    def extract(item):
+        target, info = item
+        # ZipFile handles are not safe to share, so each worker opens its own
+        if not hasattr(local, 'zipf'):
+            local.zipf = zipfile.ZipFile(archive_path, 'r')
+            handles.append(local.zipf)
+        with local.zipf.open(info) as source:
+            path = _write_stream(source, target)
+        produced.append(path)
+        return path
+
+    # zlib/lzma release the GIL, so members inflate in parallel
     try:
-        output_dir = Path(output_dir)
-        output_dir.mkdir(parents=True, exist_ok=True)
-        
-        with zipfile.ZipFile(zip_path, 'r') as zipf:
-            zipf.extractall(output_dir)
-            
-        print(f"[✓] Extracted {zip_path} to {output_dir}")
-        return str(output_dir)
+        with ThreadPoolExecutor(max_workers=EXTRACT_WORKERS) as pool:
+            return list(pool.map(extract, targets.items()))
+    except Exception:
+        # The pool has finished every member by now; don't leave half an archive behind
+        for path in produced:
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    finally:
+        for handle in handles:
+            handle.close()
+
+
+def _extract_tar(archive_path, output_dir, max_bytes, max_ratio, names=None):
+    """Single streaming pass: a compressed tar can't be entered mid-stream"""
+    produced, total = [], 0
+    try:
+        with tarfile.open(archive_path, 'r|*') as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue  # Directories are created on demand; links and devices skipped
+                if names is not None and member.name not in names:
+                    continue
+                # The header announces the size before any of the data is decompressed
+                total += member.size
+                _check_limits(archive_path, total, max_bytes, max_ratio)
+                target = _safe_target(output_dir, member.name)
+                produced.append(_write_stream(tar.extractfile(member), target))
+    except Exception:
+        # Don't leave half an archive behind
+        for path in produced:
+            os.remove(path)
+        raise
+    return produced
+
+
+def extract_file(zip_path, output_dir, members=None):
+    """Extract a zip or (compressed) tar archive; returns the list of extracted file paths
+
+    members limits extraction to those member names.
+    """
+    try:
+        output_dir = os.path.realpath(output_dir)
+        os.makedirs(output_dir, exist_ok=True)
+        max_bytes, max_ratio = _extraction_limits()
+
+        start = time.perf_counter()
+        if zipfile.is_zipfile(zip_path):
+            produced = _extract_zip(zip_path, output_dir, max_bytes, max_ratio, members)
+        elif tarfile.is_tarfile(zip_path):
+            produced = _extract_tar(zip_path, output_dir, max_bytes, max_ratio, members)
+        else:
+            raise ValueError(f"Unsupported archive format: {zip_path}")
+        elapsed = time.perf_counter() - start
+
+        total = sum(os.path.getsize(path) for path in produced)
+        print(f"[✓] Extracted {len(produced)} files from {zip_path} to {output_dir} "
+              f"({total / elapsed / 1e6 if elapsed > 0 else 0:.1f} MB/s)")
+        return produced
     except Exception as e:
         print(f"[x] Extraction failed: {str(e)}")
-
         return None
@@ -0,0 +1,174 @@
+# dedup.py
+import os
+import mmap
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from file_metadata import register_lazy_variables
+
+PARTIAL_BLOCK = 64 * 1024
+HASH_WORKERS = 4
+HASH_CHUNK = 16 * 1024 * 1024
+
+
+def partial_hash(path):
+    """Hash of the first and last 64KB (the whole file if it is smaller)"""
+    digest = hashlib.blake2b()
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        digest.update(f.read(PARTIAL_BLOCK))
+        if size > 2 * PARTIAL_BLOCK:
+            f.seek(-PARTIAL_BLOCK, os.SEEK_END)
+        digest.update(f.read(PARTIAL_BLOCK))
+    return digest.hexdigest()
+
+
+def full_hash(path):
+    """Hash of the whole file through mmap, without copying it into Python"""
+    digest = hashlib.blake2b()
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return digest.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                # hashlib drops the GIL for large updates, so pool threads overlap
+                for start in range(0, len(view), HASH_CHUNK):
+                    digest.update(view[start:start + HASH_CHUNK])
+            finally:
+                view.release()
+    return digest.hexdigest()
+
+
+class DedupIndex:
+    """Duplicate finder over watched folders: size bucket, then partial, then full hash"""
+
+    def __init__(self, workers=HASH_WORKERS):
+        self.by_size = {}   # size -> set of paths
+        self.sizes = {}     # path -> size
+        self._hashes = {}   # (kind, path) -> ((size, mtime_ns), digest)
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+
+    def add_folder(self, folder):
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.is_file(follow_symlinks=False):
+                        self._add(entry.path, entry.stat().st_size)
+        except OSError as e:
+            print(f"[x] Dedup scan failed for {folder}: {str(e)}")
+
+    def _add(self, path, size):
+        with self._lock:
+            old = self.sizes.get(path)
+            if old is not None:
+                self.by_size.get(old, set()).discard(path)
+            self.sizes[path] = size
+            self.by_size.setdefault(size, set()).add(path)
+
+    def add(self, path):
+        try:
+            self._add(path, os.path.getsize(path))
+        except OSError:
+            pass
+
+    def refresh(self, path):
+        """Re-bucket an indexed file after it changed; files still being written are left out"""
+        with self._lock:
+            if path not in self.sizes:
+                return
+        self.add(path)
+
+    def remove(self, path):
+        with self._lock:
+            size = self.sizes.pop(path, None)
+            if size is not None:
+                self.by_size.get(size, set()).discard(path)
+            self._hashes.pop(('partial', path), None)
+            self._hashes.pop(('full', path), None)
+
+    def _hash(self, kind, path):
+        """Cached hash, invalidated when size or mtime change"""
+        st = os.stat(path)
+        stamp = (st.st_size, st.st_mtime_ns)
+        cached = self._hashes.get((kind, path))
+        if cached and cached[0] == stamp:
+            return cached[1]
+        digest = (partial_hash if kind == 'partial' else full_hash)(path)
+        self._hashes[(kind, path)] = (stamp, digest)
+        return digest
+
+    def find_duplicate(self, path):
+        """Return the oldest other file with identical content, or None"""
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return None
+        if size == 0:
+            return None
+        self._add(path, size)
+
+        # Tier 1: nothing else has this size, so nothing is read at all
+        with self._lock:
+            candidates = [p for p in self.by_size.get(size, ()) if p != path]
+        candidates = [p for p in candidates if os.path.exists(p)]
+        if not candidates:
+            return None
+
+        # Tier 2: 128KB per file rules out most same-size files
+        mine = self._hash('partial', path)
+        candidates = [p for p in candidates if self._hash('partial', p) == mine]
+        if not candidates:
+            return None
+
+        # Tier 3: full hashes, in parallel, only for surviving collisions
+        paths = [path] + candidates
+        digests = dict(zip(paths, self._pool.map(lambda p: self._hash('full', p), paths)))
+        matches = [p for p in candidates if digests[p] == digests[path]]
+        if not matches:
+            return None
+
+        original = min(matches + [path], key=lambda p: (os.stat(p).st_mtime, p))
+        return None if original == path else original
+
+    def variables(self, path):
+        try:
+            original = self.find_duplicate(path)
+        except Exception as e:
+            print(f"[x] Duplicate check failed for {path}: {str(e)}")
+            original = None
+        return {'is_duplicate': original is not None, 'duplicate_of': original or ''}
+
+
+def dedupe_file(path, original, mode='delete'):
+    """Resolve a duplicate: trash it, or replace it with a hardlink to the original"""
+    if os.path.getsize(path) != os.path.getsize(original) or full_hash(path) != full_hash(original):
+        raise ValueError(f"{path} is no longer identical to {original}")
+
+    if mode == 'hardlink':
+        temp = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{os.getpid()}.link")
+        os.link(original, temp)
+        os.replace(temp, path)
+        print(f"[✓] Deduplicated {path} as a hardlink to {original}")
+        return path
+
+    from file_deleter import delete_files
+    if path not in delete_files([path])['deleted']:
+        raise RuntimeError(f"Could not delete duplicate {path}")
+    print(f"[✓] Removed duplicate {path} (kept {original})")
+    return original
+
+
+_index = None
+
+
+def get_dedup_index():
+    """Process-wide index; the monitor feeds it its watched folders"""
+    global _index
+    if _index is None:
+        _index = DedupIndex()
+    return _index
+
+
+register_lazy_variables(['is_duplicate', 'duplicate_of'], lambda path: get_dedup_index().variables(path))
@@ -0,0 +1,78 @@
+# encryption_index.py
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+ENCRYPTION_DB = 'encrypted_files.db'
+
+
+class EncryptionIndex:
+    """Every file this app encrypted and the id of the key that sealed it
+
+    Key rotation reads its work list from here instead of walking the disk.
+    """
+
+    def __init__(self, db_path=ENCRYPTION_DB):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        with self._connect() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS encrypted_files (
+                    path TEXT PRIMARY KEY, key_id TEXT, size INTEGER, updated TEXT
+                )""")
+            db.execute("CREATE INDEX IF NOT EXISTS idx_encrypted_files_key ON encrypted_files(key_id)")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def record(self, path, key_id):
+        """key_id is the hex fingerprint from the file header ('' for legacy Fernet files)"""
+        try:
+            with self._lock, self._connect() as db:
+                db.execute(
+                    "INSERT OR REPLACE INTO encrypted_files VALUES (?, ?, ?, ?)",
+                    (os.path.abspath(path), key_id, os.path.getsize(path), datetime.now().isoformat())
+                )
+        except Exception as e:
+            print(f"[x] Failed to index encrypted file {path}: {str(e)}")
+
+    def track(self, path):
+        """Index a file that arrived by move or copy, reading its key id from the header"""
+        from file_crypto import header_key_id
+        try:
+            self.record(path, header_key_id(path))
+        except Exception as e:
+            print(f"[x] Failed to index encrypted file {path}: {str(e)}")
+
+    def forget(self, path):
+        with self._lock, self._connect() as db:
+            db.execute("DELETE FROM encrypted_files WHERE path = ?", (os.path.abspath(path),))
+
+    def sealed_with_other_keys(self, key_id):
+        """Paths whose recorded key differs from key_id"""
+        with self._lock, self._connect() as db:
+            return [row[0] for row in db.execute(
+                "SELECT path FROM encrypted_files WHERE key_id != ? ORDER BY size DESC", (key_id,)
+            )]
+
+    def scan(self, folder):
+        """One-off registration of .encrypted files made before the index existed"""
+        count = 0
+        for root, _, files in os.walk(folder):
+            for name in files:
+                if name.endswith('.encrypted'):
+                    self.track(os.path.join(root, name))
+                    count += 1
+        return count
+
+
+_index = None
+
+
+def get_encryption_index():
+    """Process-wide index shared by the encryptor, sorter and key rotation"""
+    global _index
+    if _index is None:
+        _index = EncryptionIndex()
+    return _index
@@ -1,6 +1,39 @@
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, MultiFernet, InvalidToken
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+import io
 import os
+import json
+import mmap
+import base64
+import hashlib
+import time
+import struct
 import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from encryption_index import get_encryption_index
+
+# Segmented format: header, then fixed-size chunks each sealed on its own
+#   magic(4) version(1) algorithm(1) reserved(2) chunk_size(4) key_id(8) nonce_prefix(8)
+# Chunk i is encrypted with nonce nonce_prefix + i and authenticated
+# together with the header, its index and whether it is the last one, so
+# chunks can't be reordered, swapped between files or cut off the end.
+STREAM_MAGIC = b'DCAE'
+STREAM_VERSION = 1
+STREAM_HEADER = struct.Struct('>4sBBHI8s8s')
+CHUNK_SIZE = 1024 * 1024
+TAG_SIZE = 16
+ALG_AES_GCM = 1
+ALG_CHACHA20 = 2
+CIPHERS = {ALG_AES_GCM: AESGCM, ALG_CHACHA20: ChaCha20Poly1305}
+# Files with at least this many chunks are sealed by several threads at once
+PARALLEL_MIN_CHUNKS = 8
+CRYPTO_WORKERS = os.cpu_count() or 1
+# Keys replaced by rotation, kept so files sealed with them stay readable
+RETIRED_KEYS_FILE = 'retired_keys.json'
 
 def generate_key(key_path='encryption_key.key'):
     """Generate and save encryption key"""
@@ -21,52 +54,455 @@ def load_key(key_path='encryption_key.key'):
     with open(key_path, 'rb') as f:
         return f.read()
 
-def encrypt_file(input_path, key=None, output_path=None):
-    """Encrypt a file with optional custom output path"""
+def _raw_key(key):
+    """The 32 bytes behind a urlsafe-base64 key file"""
+    return base64.urlsafe_b64decode(key)
+
+
+def key_id(key):
+    """Short fingerprint stored in headers to tell which key sealed a file"""
+    return hashlib.sha256(b'declutter key id' + _raw_key(key)).digest()[:8]
+
+
+def _stream_key(key):
+    """Separate AEAD key derived from the same key file Fernet uses"""
+    return HKDF(algorithm=hashes.SHA256(), length=32, salt=None,
+                info=b'declutter stream encryption').derive(_raw_key(key))
+
+
+def load_retired_keys(path=RETIRED_KEYS_FILE):
+    """Retired keys, newest first"""
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        return [entry['key'].encode('ascii') for entry in reversed(json.load(f))]
+
+
+class Keyring:
+    """The key file and the AEAD ciphers derived from it
+
+    Files name the key that sealed them by its key_id, so after a rotation
+    older files are opened with the matching retired key. The key file's
+    mtime is checked on every use, so a rotation made by another process
+    is picked up before the next file is sealed.
+    """
+
+    def __init__(self, key_path='encryption_key.key', retired_path=RETIRED_KEYS_FILE):
+        self.key_path = key_path
+        self.retired_path = retired_path
+        self._key = None
+        self._key_mtime = None
+        self._retired = None
+        self._ciphers = {}  # (algorithm, key) -> cipher; they are safe to share
+        self._lock = threading.Lock()
+
+    @property
+    def key(self):
+        try:
+            mtime = os.stat(self.key_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        with self._lock:
+            if self._key is None or mtime != self._key_mtime:
+                # Rotation retires the old key before replacing the key file
+                self._key = load_key(self.key_path)
+                self._key_mtime = mtime
+                self._retired = None
+            return self._key
+
+    @property
+    def retired(self):
+        self.key  # Refreshes both if the key file changed
+        with self._lock:
+            if self._retired is None:
+                self._retired = load_retired_keys(self.retired_path)
+            return self._retired
+
+    def reload(self):
+        """Forget the cached keys after a rotation"""
+        with self._lock:
+            self._key = None
+            self._key_mtime = None
+            self._retired = None
+
+    def key_for(self, file_key_id):
+        """The current or retired key whose fingerprint is file_key_id"""
+        for key in [self.key] + self.retired:
+            if key_id(key) == file_key_id:
+                return key
+        raise ValueError("File was encrypted with a key that is not on this machine")
+
+    def fernet(self):
+        """Legacy Fernet files may have been sealed by any key, current or retired"""
+        return MultiFernet([Fernet(key) for key in [self.key] + self.retired])
+
+    def cipher(self, algorithm, key=None):
+        key = key or self.key
+        with self._lock:
+            if (algorithm, key) not in self._ciphers:
+                self._ciphers[(algorithm, key)] = CIPHERS[algorithm](_stream_key(key))
+            return self._ciphers[(algorithm, key)]
+
+
+_keyring = None
+
+
+def get_keyring():
+    """Process-wide keyring"""
+    global _keyring
+    if _keyring is None:
+        _keyring = Keyring()
+    return _keyring
+
+
+def _chunk_nonce(nonce_prefix, index):
+    return nonce_prefix + struct.pack('>I', index)
+
+
+def _chunk_aad(header, index, last):
+    return header + struct.pack('>IB', index, last)
+
+
+def _read_full(stream, size):
+    """Read exactly size bytes unless the stream ends first"""
+    data = bytearray()
+    while len(data) < size:
+        block = stream.read(size - len(data))
+        if not block:
+            break
+        data += block
+    return bytes(data)
+
+
+def is_stream_encrypted(path):
+    with open(path, 'rb') as f:
+        return f.read(len(STREAM_MAGIC)) == STREAM_MAGIC
+
+
+def header_key_id(path):
+    """Hex key_id from a file's header; '' for legacy Fernet files, which carry none"""
+    if not is_stream_encrypted(path):
+        return ''
+    with open(path, 'rb') as f:
+        return read_stream_header(f)[1]['key_id'].hex()
+
+
+def _new_header(key, chunk_size, algorithm):
+    nonce_prefix = os.urandom(8)
+    header = STREAM_HEADER.pack(STREAM_MAGIC, STREAM_VERSION, algorithm, 0, chunk_size, key_id(key), nonce_prefix)
+    return header, nonce_prefix
+
+
+def encrypt_stream(source, destination, key, chunk_size=CHUNK_SIZE, algorithm=ALG_AES_GCM):
+    """Encrypt file-like source into destination in constant memory; returns bytes written"""
+    header, nonce_prefix = _new_header(key, chunk_size, algorithm)
+    cipher = get_keyring().cipher(algorithm, key)
+    destination.write(header)
+    written = len(header)
+
+    index, chunk = 0, _read_full(source, chunk_size)
+    while True:
+        # Read one chunk ahead to know which chunk is the last
+        following = _read_full(source, chunk_size) if len(chunk) == chunk_size else b''
+        last = not following
+        sealed = cipher.encrypt(_chunk_nonce(nonce_prefix, index), chunk, _chunk_aad(header, index, last))
+        destination.write(sealed)
+        written += len(sealed)
+        if last:
+            return written
+        index, chunk = index + 1, following
+
+
+def read_stream_header(source):
+    """Parse and check a segmented-format header; returns (header bytes, fields)"""
+    header = _read_full(source, STREAM_HEADER.size)
+    if len(header) < STREAM_HEADER.size:
+        raise ValueError("Truncated encrypted file")
+    magic, version, algorithm, _, chunk_size, file_key_id, nonce_prefix = STREAM_HEADER.unpack(header)
+    if magic != STREAM_MAGIC or version != STREAM_VERSION or algorithm not in CIPHERS:
+        raise ValueError("Unsupported encrypted file format")
+    return header, {'algorithm': algorithm, 'chunk_size': chunk_size,
+                    'key_id': file_key_id, 'nonce_prefix': nonce_prefix}
+
+
+def _key_for_header(fields, key):
+    """key if it sealed the file; with no key, whichever known key did"""
+    if key is None:
+        return get_keyring().key_for(fields['key_id'])
+    if fields['key_id'] != key_id(key):
+        raise ValueError("File was encrypted with a different key")
+    return key
+
+
+def decrypt_stream(source, destination, key=None):
+    """Decrypt a segmented file-like source into destination in constant memory"""
+    header, fields = read_stream_header(source)
+    key = _key_for_header(fields, key)
+    cipher = get_keyring().cipher(fields['algorithm'], key)
+    sealed_size = fields['chunk_size'] + TAG_SIZE
+
+    index, sealed = 0, _read_full(source, sealed_size)
+    written = 0
+    while True:
+        following = _read_full(source, sealed_size) if len(sealed) == sealed_size else b''
+        last = not following
+        try:
+            chunk = cipher.decrypt(_chunk_nonce(fields['nonce_prefix'], index), sealed,
+                                   _chunk_aad(header, index, last))
+        except InvalidTag:
+            raise ValueError("Invalid key or corrupted file")
+        destination.write(chunk)
+        written += len(chunk)
+        if last:
+            return written
+        index, sealed = index + 1, following
+
+
+def _read_at(f, size, offset, lock):
+    """Positioned read; platforms without pread share the handle under a lock"""
+    if hasattr(os, 'pread'):
+        return os.pread(f.fileno(), size, offset)
+    with lock:
+        f.seek(offset)
+        return f.read(size)
+
+
+def _write_at(f, data, offset, lock):
+    if hasattr(os, 'pwrite'):
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(f.fileno(), view, offset)
+            view, offset = view[written:], offset + written
+        return
+    with lock:
+        f.seek(offset)
+        f.write(data)
+
+
+def encrypt_parallel(source, destination, size, key, chunk_size=CHUNK_SIZE,
+                     algorithm=ALG_AES_GCM, workers=CRYPTO_WORKERS):
+    """Seal the chunks of a regular file on several threads, each written at its own offset
+
+    Chunk i always lands at header + i * (chunk_size + TAG_SIZE), so the
+    output is exactly what encrypt_stream would write. The AEAD calls
+    release the GIL, and at most two chunks per worker are held in memory.
+    """
+    header, nonce_prefix = _new_header(key, chunk_size, algorithm)
+    cipher = get_keyring().cipher(algorithm, key)
+    count = max(1, -(-size // chunk_size))
+    lock = threading.Lock()
+    _write_at(destination, header, 0, lock)
+
+    def seal(index):
+        chunk = _read_at(source, chunk_size, index * chunk_size, lock)
+        last = index == count - 1
+        if len(chunk) != (size - index * chunk_size if last else chunk_size):
+            raise ValueError("File changed while it was being encrypted")
+        sealed = cipher.encrypt(_chunk_nonce(nonce_prefix, index), chunk, _chunk_aad(header, index, last))
+        _write_at(destination, sealed, len(header) + index * (chunk_size + TAG_SIZE), lock)
+        return len(sealed)
+
+    written, in_flight = len(header), []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for index in range(count):
+            if len(in_flight) >= workers * 2:
+                written += in_flight.pop(0).result()
+            in_flight.append(pool.submit(seal, index))
+        for future in in_flight:
+            written += future.result()
+    return written
+
+
+class EncryptedReader(io.RawIOBase):
+    """Seekable plaintext view of a segmented encrypted file
+
+    The fixed chunk geometry is the chunk index: chunk i sits at
+    header + i * (chunk_size + TAG_SIZE), and the chunk count and plaintext
+    size follow from the file length. A read decrypts and authenticates only
+    the chunks it covers, in memory. The file is mmapped where possible.
+    """
+
+    def __init__(self, path, key=None):
+        super().__init__()
+        self._map = None
+        self._file = open(path, 'rb')
+        try:
+            self._header, fields = read_stream_header(self._file)
+            key = _key_for_header(fields, key)
+            self.algorithm = fields['algorithm']
+            self._cipher = get_keyring().cipher(fields['algorithm'], key)
+            self._nonce_prefix = fields['nonce_prefix']
+            self.chunk_size = fields['chunk_size']
+            self._sealed_size = self.chunk_size + TAG_SIZE
+            self._file_size = os.fstat(self._file.fileno()).st_size
+            body = self._file_size - len(self._header)
+            self._chunks = max(1, -(-body // self._sealed_size))
+            last_sealed = body - (self._chunks - 1) * self._sealed_size
+            if last_sealed < TAG_SIZE:
+                raise ValueError("Truncated encrypted file")
+            self.size = (self._chunks - 1) * self.chunk_size + last_sealed - TAG_SIZE
+            try:
+                self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                self._map = None  # Fall back to seek + read
+        except BaseException:
+            self._file.close()
+            raise
+        self._position = 0
+        self._cached = (None, b'')
+
+    def _sealed(self, index):
+        offset = len(self._header) + index * self._sealed_size
+        end = min(offset + self._sealed_size, self._file_size)
+        if self._map is not None:
+            return self._map[offset:end]
+        self._file.seek(offset)
+        return self._file.read(end - offset)
+
+    def _chunk(self, index):
+        if self._cached[0] == index:
+            return self._cached[1]
+        last = index == self._chunks - 1
+        try:
+            chunk = self._cipher.decrypt(_chunk_nonce(self._nonce_prefix, index), self._sealed(index),
+                                         _chunk_aad(self._header, index, last))
+        except InvalidTag:
+            raise ValueError("Invalid key or corrupted file")
+        self._cached = (index, chunk)
+        return chunk
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: self.size}[whence]
+        if base + offset < 0:
+            raise ValueError("Negative seek position")
+        self._position = base + offset
+        return self._position
+
+    def readinto(self, buffer):
+        view = memoryview(buffer).cast('B')
+        filled = 0
+        while filled < len(view) and self._position < self.size:
+            index, offset = divmod(self._position, self.chunk_size)
+            piece = self._chunk(index)[offset:offset + len(view) - filled]
+            view[filled:filled + len(piece)] = piece
+            filled += len(piece)
+            self._position += len(piece)
+        return filled
+
+    def close(self):
+        if not self.closed:
+            if getattr(self, '_map', None) is not None:
+                self._map.close()
+            if hasattr(self, '_file'):
+                self._file.close()
+        super().close()
+
+
+def open_encrypted(path, key=None):
+    """Readable, seekable plaintext of an encrypted file, without writing it to disk
+
+    Legacy Fernet files can't be read partially and are decrypted into memory.
+    """
+    if is_stream_encrypted(path):
+        return io.BufferedReader(EncryptedReader(path, key))
+    with open(path, 'rb') as f:
+        try:
+            fernet = Fernet(key) if key else get_keyring().fernet()
+            return io.BytesIO(fernet.decrypt(f.read()))
+        except InvalidToken:
+            raise ValueError("Invalid key or corrupted file")
+
+
+def _throughput(size, start):
+    elapsed = time.perf_counter() - start
+    return size / elapsed / 1e6 if elapsed > 0 else 0.0
+
+
+def _write_atomically(output_path, produce):
+    """Run produce(file) into a temp file and move it into place only if it succeeds"""
+    temp = f"{output_path}.part"
+    try:
+        with open(temp, 'wb') as out:
+            produce(out)
+        os.replace(temp, output_path)
+    except BaseException:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+
+
+def encrypt_file(input_path, key=None, output_path=None, chunk_size=CHUNK_SIZE, algorithm=ALG_AES_GCM):
+    """Encrypt a file in the segmented format with optional custom output path"""
     if not os.path.exists(input_path):
         raise FileNotFoundError(f"Input file not found: {input_path}")
     
     if not key:
-        key = load_key()
-    
-    fernet = Fernet(key)
+        key = get_keyring().key
     
-    with open(input_path, 'rb') as f:
-        file_data = f.read()
-    
-    encrypted_data = fernet.encrypt(file_data)
     output_path = output_path or f"{input_path}.encrypted"
     
-    with open(output_path, 'wb') as f:
-        f.write(encrypted_data)
+    start = time.perf_counter()
+    size = os.path.getsize(input_path)
+    with open(input_path, 'rb') as f:
+        if size >= PARALLEL_MIN_CHUNKS * chunk_size:
+            _write_atomically(output_path, lambda out: encrypt_parallel(f, out, size, key, chunk_size, algorithm))
+        else:
+            _write_atomically(output_path, lambda out: encrypt_stream(f, out, key, chunk_size, algorithm))
+    get_encryption_index().record(output_path, key_id(key).hex())
     
-    print(f"[✓] Encrypted {input_path} -> {output_path}")
+    print(f"[✓] Encrypted {input_path} -> {output_path} ({_throughput(size, start):.1f} MB/s)")
     return output_path
 
+
+def encrypt_files(paths, key=None, workers=CRYPTO_WORKERS):
+    """Encrypt many files on a thread pool, yielding (path, output path or None) as each finishes"""
+    key = key or get_keyring().key
+    start, total = time.perf_counter(), 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(encrypt_file, path, key): path for path in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                output = future.result()
+                total += os.path.getsize(path)
+            except Exception as e:
+                print(f"[x] Encryption failed for {path}: {str(e)}")
+                output = None
+            yield path, output
+    print(f"[✓] Encrypted {len(futures)} files at {_throughput(total, start):.1f} MB/s overall")
+
 def decrypt_file(input_path, key=None, output_path=None):
     """Decrypt a file with optional custom output path"""
     if not os.path.exists(input_path):
         raise FileNotFoundError(f"Input file not found: {input_path}")
     
-    if not key:
-        key = load_key()
-    
-    fernet = Fernet(key)
-    
-    with open(input_path, 'rb') as f:
-        encrypted_data = f.read()
-    
-    try:
-        decrypted_data = fernet.decrypt(encrypted_data)
-    except:
-        raise ValueError("Invalid key or corrupted file")
-    
     output_path = output_path or input_path.replace('.encrypted', '')
+    start = time.perf_counter()
     
-    with open(output_path, 'wb') as f:
-        f.write(decrypted_data)
+    if is_stream_encrypted(input_path):
+        with open(input_path, 'rb') as f:
+            _write_atomically(output_path, lambda out: decrypt_stream(f, out, key))
+    else:
+        # Files from before the segmented format are single Fernet tokens
+        with open(input_path, 'rb') as f:
+            encrypted_data = f.read()
+        try:
+            decrypted_data = (Fernet(key) if key else get_keyring().fernet()).decrypt(encrypted_data)
+        except InvalidToken:
+            raise ValueError("Invalid key or corrupted file")
+        _write_atomically(output_path, lambda out: out.write(decrypted_data))
     
-    print(f"[✓] Decrypted {input_path} -> {output_path}")
+    print(f"[✓] Decrypted {input_path} -> {output_path} "
+          f"({_throughput(os.path.getsize(output_path), start):.1f} MB/s)")
     return output_path
 
 def main():
@@ -81,21 +517,37 @@ def main():
     enc_parser = subparsers.add_parser('encrypt', help='Encrypt a file')
     enc_parser.add_argument('input', help='File to encrypt')
     enc_parser.add_argument('-o', '--output', help='Output path')
+    enc_parser.add_argument('--cipher', choices=['aes-gcm', 'chacha20'], default='aes-gcm',
+                            help='AEAD cipher for the stream format')
+    enc_parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Stream chunk size in bytes')
 
-    # Decrypt command
+    # Decrypt command (segmented and legacy Fernet files are told apart by their header)
     dec_parser = subparsers.add_parser('decrypt', help='Decrypt a file')
     dec_parser.add_argument('input', help='File to decrypt')
     dec_parser.add_argument('-o', '--output', help='Output path')
 
+    # Key rotation: retire the current key, then move indexed files onto the new one
+    subparsers.add_parser('rotate', help='Replace the key and re-encrypt indexed files')
+    reenc_parser = subparsers.add_parser('reencrypt', help='Resume or rerun re-encryption under the current key')
+    reenc_parser.add_argument('--scan', metavar='FOLDER', help='Index .encrypted files under FOLDER first')
+
     args = parser.parse_args()
 
     try:
         if args.command == 'genkey':
             generate_key()
         elif args.command == 'encrypt':
-            encrypt_file(args.input, output_path=args.output)
+            encrypt_file(args.input, output_path=args.output, chunk_size=args.chunk_size,
+                         algorithm=ALG_CHACHA20 if args.cipher == 'chacha20' else ALG_AES_GCM)
         elif args.command == 'decrypt':
             decrypt_file(args.input, output_path=args.output)
+        elif args.command in ('rotate', 'reencrypt'):
+            from key_rotation import rotate_key, reencrypt_all
+            if args.command == 'rotate':
+                rotate_key()
+            elif args.scan:
+                print(f"[✓] Indexed {get_encryption_index().scan(args.scan)} encrypted files")
+            reencrypt_all()
         else:
             parser.print_help()
     except Exception as e:
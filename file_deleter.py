@@ -1,16 +1,118 @@
 # file_deleter.py
 import os
-import send2trash 
+import json
+import send2trash
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from file_transfer import device_of
+
+DELETION_LEDGER = 'deletion_ledger.jsonl'
+MAX_DELETE_WORKERS = 4
+TRASH_BATCH_SIZE = 200
+
 
 def delete_file(filepath):
     """Safely delete file with backup option"""
+    return filepath in delete_files([filepath])['deleted']
+
+
+def parse_schedule_entry(value):
+    """files_to_be_deleted.txt values: an ISO date, or {"time": ..., "disposable": true}"""
+    if isinstance(value, dict):
+        return datetime.fromisoformat(value['time']), bool(value.get('disposable'))
+    return datetime.fromisoformat(value), False
+
+
+def schedule_deletions(entries, schedule_path='files_to_be_deleted.txt'):
+    """Add (path, when, disposable) entries to the deletion schedule"""
+    if not entries:
+        return
+    try:
+        with open(schedule_path, 'r') as f:
+            scheduled = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        scheduled = {}
+    for path, when, disposable in entries:
+        scheduled[path] = {'time': when.isoformat(), 'disposable': disposable}
+    with open(schedule_path, 'w') as f:
+        json.dump(scheduled, f, indent=2)
+    print(f"[✓] Scheduled {len(entries)} files for deletion")
+
+
+def _trash_group(paths):
+    """Send one volume's files to its trash in as few shell operations as possible"""
+    deleted = []
+    for start in range(0, len(paths), TRASH_BATCH_SIZE):
+        chunk = paths[start:start + TRASH_BATCH_SIZE]
+        try:
+            send2trash.send2trash(chunk)
+            deleted.extend(chunk)
+        except Exception:
+            # Retry one by one so a single bad path doesn't fail the chunk
+            for path in chunk:
+                try:
+                    send2trash.send2trash(path)
+                    deleted.append(path)
+                except Exception as e:
+                    print(f"[x] Deletion failed: {str(e)}")
+    return deleted
+
+
+def _unlink_group(paths):
+    deleted = []
+    for path in paths:
+        try:
+            os.unlink(path)
+            deleted.append(path)
+        except OSError as e:
+            print(f"[x] Deletion failed: {str(e)}")
+    return deleted
+
+
+def _write_ledger(tier, deleted, sizes):
+    """One compact line per batch: when, how, and what was freed"""
+    if not deleted:
+        return
     try:
-        if os.path.exists(filepath):
-            send2trash.send2trash(filepath)
-            print(f"[✓] Sent to recycle bin: {filepath}")
-            return True
-        return False 
+        with open(DELETION_LEDGER, 'a') as f:
+            f.write(json.dumps({
+                't': datetime.now().isoformat(timespec='seconds'),
+                'tier': tier,
+                'files': [[path, sizes.get(path, 0)] for path in deleted],
+            }, separators=(',', ':')) + '\n')
     except Exception as e:
-        print(f"[x] Deletion failed: {str(e)}")
-        return False
+        print(f"[x] Failed to write deletion ledger: {str(e)}")
+
+
+def delete_files(paths, disposable=False):
+    """Delete a batch of files, grouped per volume and run in parallel
+
+    Regular files go to the recycle bin of their volume; files a rule marks
+    as disposable are unlinked directly. Returns the deleted paths and the
+    bytes freed.
+    """
+    sizes = {}
+    for path in paths:
+        try:
+            sizes[path] = os.path.getsize(path)
+        except OSError:
+            pass  # Already gone
+
+    groups = {}
+    for path in sizes:
+        groups.setdefault(device_of(path), []).append(path)
+
+    worker = _unlink_group if disposable else _trash_group
+    deleted = []
+    if groups:
+        with ThreadPoolExecutor(max_workers=min(MAX_DELETE_WORKERS, len(groups))) as pool:
+            for group_deleted in pool.map(worker, groups.values()):
+                deleted.extend(group_deleted)
 
+    tier = 'unlink' if disposable else 'trash'
+    freed = sum(sizes[path] for path in deleted)
+    _write_ledger(tier, deleted, sizes)
+    if deleted:
+        verb = "Unlinked" if disposable else "Sent to recycle bin"
+        print(f"[✓] {verb}: {len(deleted)} files, {freed / 1e6:.1f} MB freed")
+    return {'deleted': deleted, 'freed_bytes': freed}
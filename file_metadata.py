@@ -0,0 +1,353 @@
+# file_metadata.py
+import os
+import re
+import zlib
+import zipfile
+import contextlib
+from collections import Counter
+from xml.etree import ElementTree
+
+# Encrypted files are read through file_crypto.open_encrypted, never decrypted to disk
+ENCRYPTED_SUFFIX = '.encrypted'
+PDF_TAIL_SIZE = 4096
+PDF_OBJECT_READ_SIZE = 4096
+
+_STARTXREF = re.compile(rb"startxref\s+(\d+)")
+_REF = rb"\s+(\d+)\s+(\d+)\s+R"
+
+
+# ---------------------------------------------------------------- PDF
+
+def _pdf_ref(data, key):
+    """Return the object number referenced by /key in a PDF dictionary"""
+    match = re.search(rb"/" + key + _REF, data)
+    return int(match.group(1)) if match else None
+
+
+def _pdf_int(data, key):
+    match = re.search(rb"/" + key + rb"\s+(\d+)", data)
+    return int(match.group(1)) if match else None
+
+
+def _pdf_string(data, key):
+    """Decode a literal (...) or hex <...> PDF string value"""
+    match = re.search(rb"/" + key + rb"\s*(\((?:\\.|[^\\)])*\)|<[0-9A-Fa-f\s]*>)", data, re.S)
+    if not match:
+        return ''
+    raw = match.group(1)
+    if raw.startswith(b'<'):
+        raw = bytes.fromhex(re.sub(rb"\s", b'', raw[1:-1]).decode())
+    else:
+        raw = re.sub(rb"\\([nrtbf()\\])",
+                     lambda m: {b'n': b'\n', b'r': b'\r', b't': b'\t',
+                                b'b': b'\b', b'f': b'\f'}.get(m.group(1), m.group(1)),
+                     raw[1:-1])
+        raw = re.sub(rb"\\([0-7]{1,3})", lambda m: bytes([int(m.group(1), 8) & 0xFF]), raw)
+    if raw.startswith(b'\xfe\xff'):
+        return raw[2:].decode('utf-16-be', errors='ignore').strip()
+    return raw.decode('latin-1').strip()
+
+
+def _unpredict(data, columns):
+    """Undo the PNG 'Up' predictor used by most xref streams"""
+    rows, previous = [], bytes(columns)
+    for i in range(0, len(data), columns + 1):
+        filter_type, row = data[i], bytearray(data[i + 1:i + 1 + columns])
+        if filter_type == 2:
+            for j in range(len(row)):
+                row[j] = (row[j] + previous[j]) & 0xFF
+        elif filter_type != 0:
+            raise ValueError(f"Unsupported PNG predictor {filter_type}")
+        rows.append(bytes(row))
+        previous = row
+    return b''.join(rows)
+
+
+class _PdfReader:
+    """Resolve just the objects needed for metadata via the cross-reference data"""
+
+    def __init__(self, f):
+        self.f = f
+        self.offsets = {}      # obj number -> byte offset
+        self.compressed = {}   # obj number -> (object stream number, index)
+        self.trailer = b''
+        self._objstm_cache = {}
+
+    def _read_at(self, offset, size):
+        self.f.seek(offset)
+        return self.f.read(size)
+
+    def load_xref(self):
+        self.f.seek(0, os.SEEK_END)
+        size = self.f.tell()
+        tail = self._read_at(max(0, size - PDF_TAIL_SIZE), PDF_TAIL_SIZE)
+        matches = _STARTXREF.findall(tail)
+        if not matches:
+            raise ValueError("startxref not found")
+
+        offset, seen = int(matches[-1]), set()
+        while offset is not None and offset not in seen:
+            seen.add(offset)
+            head = self._read_at(offset, 32)
+            if head.lstrip().startswith(b'xref'):
+                offset = self._load_xref_table(offset)
+            else:
+                offset = self._load_xref_stream(offset)
+
+    def _keep_trailer(self, trailer):
+        # The newest trailer wins; older ones only fill in missing entries
+        if not self.trailer:
+            self.trailer = trailer
+
+    def _load_xref_table(self, offset):
+        self.f.seek(offset)
+        self.f.readline()  # "xref"
+        while True:
+            line = self.f.readline()
+            if not line:
+                return None
+            stripped = line.strip()
+            if stripped.startswith(b'trailer'):
+                trailer = stripped[7:] + self.f.read(PDF_OBJECT_READ_SIZE)
+                trailer = trailer.split(b'startxref')[0]
+                self._keep_trailer(trailer)
+                return _pdf_int(trailer, b'Prev')
+            parts = stripped.split()
+            if len(parts) != 2:
+                continue
+            start, count = int(parts[0]), int(parts[1])
+            # Entries are fixed 20-byte records, one read per subsection
+            entries = self.f.read(count * 20)
+            for i in range(count):
+                entry = entries[i * 20:i * 20 + 18].split()
+                if len(entry) == 3 and entry[2] == b'n':
+                    self.offsets.setdefault(start + i, int(entry[0]))
+
+    def _read_stream(self, offset):
+        """Return (dictionary bytes, decoded stream bytes) for the object at offset"""
+        data = self._read_at(offset, PDF_OBJECT_READ_SIZE)
+        dict_end = data.find(b'stream')
+        if dict_end < 0:
+            raise ValueError("Expected a stream object")
+        header = data[:dict_end]
+        length = _pdf_int(header, b'Length')
+        if length is None:
+            raise ValueError("Indirect stream lengths are not supported")
+        body_start = offset + dict_end + len(b'stream')
+        body = self._read_at(body_start, length + 2).lstrip(b'\r\n')[:length]
+        if b'/FlateDecode' in header:
+            body = zlib.decompress(body)
+        predictor = _pdf_int(header, b'Predictor')
+        if predictor and predictor >= 10:
+            body = _unpredict(body, _pdf_int(header, b'Columns') or 1)
+        return header, body
+
+    def _load_xref_stream(self, offset):
+        header, body = self._read_stream(offset)
+        self._keep_trailer(header)
+        widths = [int(w) for w in re.search(rb"/W\s*\[([\d\s]+)\]", header).group(1).split()]
+        index = re.search(rb"/Index\s*\[([\d\s]+)\]", header)
+        if index:
+            numbers = [int(n) for n in index.group(1).split()]
+            sections = list(zip(numbers[::2], numbers[1::2]))
+        else:
+            sections = [(0, _pdf_int(header, b'Size'))]
+
+        record, pos = sum(widths), 0
+        for start, count in sections:
+            for obj_num in range(start, start + count):
+                fields, field_pos = [], pos
+                for width in widths:
+                    fields.append(int.from_bytes(body[field_pos:field_pos + width], 'big'))
+                    field_pos += width
+                pos += record
+                kind = fields[0] if widths[0] else 1
+                if kind == 1:
+                    self.offsets.setdefault(obj_num, fields[1])
+                elif kind == 2:
+                    self.compressed.setdefault(obj_num, (fields[1], fields[2]))
+        return _pdf_int(header, b'Prev')
+
+    def get_object(self, obj_num):
+        if obj_num is None:
+            return b''
+        if obj_num in self.offsets:
+            data = self._read_at(self.offsets[obj_num], PDF_OBJECT_READ_SIZE)
+            return data.split(b'endobj')[0]
+        if obj_num in self.compressed:
+            stream_num, index = self.compressed[obj_num]
+            if stream_num not in self._objstm_cache:
+                self._objstm_cache[stream_num] = self._read_stream(self.offsets[stream_num])
+            header, body = self._objstm_cache[stream_num]
+            first = _pdf_int(header, b'First')
+            pairs = [int(n) for n in body[:first].split()]
+            starts = pairs[1::2]
+            begin = first + starts[index]
+            end = first + starts[index + 1] if index + 1 < len(starts) else len(body)
+            return body[begin:end]
+        return b''
+
+
+def _open_binary(source):
+    """Open a path, or pass an already open file object through"""
+    if isinstance(source, (str, os.PathLike)):
+        return open(source, 'rb')
+    return contextlib.nullcontext(source)
+
+
+def read_pdf_metadata(filepath):
+    """Read page count, title and author from the PDF trailer without a full parse"""
+    metadata = {'pdf_pages': 0, 'pdf_title': '', 'pdf_author': ''}
+    try:
+        with _open_binary(filepath) as f:
+            reader = _PdfReader(f)
+            reader.load_xref()
+            root = reader.get_object(_pdf_ref(reader.trailer, b'Root'))
+            pages = reader.get_object(_pdf_ref(root, b'Pages'))
+            metadata['pdf_pages'] = _pdf_int(pages, b'Count') or 0
+
+            info = reader.get_object(_pdf_ref(reader.trailer, b'Info'))
+            metadata['pdf_title'] = _pdf_string(info, b'Title')
+            metadata['pdf_author'] = _pdf_string(info, b'Author')
+    except Exception as e:
+        print(f"[x] PDF metadata extraction failed for {filepath}: {str(e)}")
+    return metadata
+
+
+# ---------------------------------------------------------------- DOCX
+
+_CORE_FIELDS = {
+    'doc_title': '{http://purl.org/dc/elements/1.1/}title',
+    'doc_author': '{http://purl.org/dc/elements/1.1/}creator',
+    'doc_subject': '{http://purl.org/dc/elements/1.1/}subject',
+    'doc_keywords': '{http://schemas.openxmlformats.org/package/2006/metadata/core-properties}keywords',
+    'doc_last_modified_by': '{http://schemas.openxmlformats.org/package/2006/metadata/core-properties}lastModifiedBy',
+    'doc_created': '{http://purl.org/dc/terms/}created',
+    'doc_modified': '{http://purl.org/dc/terms/}modified',
+}
+_APP_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/extended-properties}'
+
+
+def read_docx_metadata(filepath):
+    """Read core properties straight from docProps/ inside the DOCX zip"""
+    metadata = {name: '' for name in _CORE_FIELDS}
+    metadata['doc_pages'] = 0
+    try:
+        # ZipFile only parses the central directory; members are read on demand
+        with zipfile.ZipFile(filepath) as zipf:
+            names = set(zipf.namelist())
+            if 'docProps/core.xml' in names:
+                core = ElementTree.fromstring(zipf.read('docProps/core.xml'))
+                for name, tag in _CORE_FIELDS.items():
+                    element = core.find(tag)
+                    if element is not None and element.text:
+                        metadata[name] = element.text.strip()
+            if 'docProps/app.xml' in names:
+                app = ElementTree.fromstring(zipf.read('docProps/app.xml'))
+                pages = app.find(f'{_APP_NS}Pages')
+                if pages is not None and (pages.text or '').isdigit():
+                    metadata['doc_pages'] = int(pages.text)
+    except Exception as e:
+        print(f"[x] DOCX metadata extraction failed for {filepath}: {str(e)}")
+    return metadata
+
+
+# ---------------------------------------------------------------- ZIP
+
+def read_zip_metadata(filepath):
+    """Summarise a ZIP archive from its central directory"""
+    metadata = {'zip_members': 0, 'zip_uncompressed_size': 0, 'zip_dominant_ext': ''}
+    try:
+        with zipfile.ZipFile(filepath) as zipf:
+            members = [info for info in zipf.infolist() if not info.is_dir()]
+        extensions = Counter(
+            os.path.splitext(info.filename)[1][1:].lower() for info in members
+        )
+        extensions.pop('', None)
+        metadata['zip_members'] = len(members)
+        metadata['zip_uncompressed_size'] = sum(info.file_size for info in members)
+        if extensions:
+            metadata['zip_dominant_ext'] = extensions.most_common(1)[0][0]
+    except Exception as e:
+        print(f"[x] ZIP metadata extraction failed for {filepath}: {str(e)}")
+    return metadata
+
+
+# ---------------------------------------------------------------- rule variables
+
+# filetype -> extractor; every variable an extractor can produce is listed so
+# rules see sensible defaults for other file types instead of a NameError
+METADATA_EXTRACTORS = {
+    'pdf': (read_pdf_metadata, {'pdf_pages': 0, 'pdf_title': '', 'pdf_author': ''}),
+    'docx': (read_docx_metadata, {**{name: '' for name in _CORE_FIELDS}, 'doc_pages': 0}),
+    'zip': (read_zip_metadata, {'zip_members': 0, 'zip_uncompressed_size': 0, 'zip_dominant_ext': ''}),
+}
+
+METADATA_VARIABLES = {
+    name: filetype
+    for filetype, (_, defaults) in METADATA_EXTRACTORS.items()
+    for name in defaults
+}
+
+# Other modules register file-independent lazy variables here:
+# variable name -> resolver(filepath) returning a dict of one or more values
+LAZY_RESOLVERS = {}
+
+
+def register_lazy_variables(names, resolver):
+    """Expose resolver(filepath) -> {name: value} as lazily resolved rule variables"""
+    for name in names:
+        LAZY_RESOLVERS[name] = resolver
+
+
+def source_filetype(filepath):
+    """Extension of the file, or of the original for name.ext.encrypted"""
+    if filepath.lower().endswith(ENCRYPTED_SUFFIX):
+        filepath = filepath[:-len(ENCRYPTED_SUFFIX)]
+    return os.path.splitext(filepath)[1][1:].lower()
+
+
+def _extract(extractor, filepath, defaults):
+    if not filepath.lower().endswith(ENCRYPTED_SUFFIX):
+        return extractor(filepath)
+    try:
+        from file_crypto import open_encrypted
+        with open_encrypted(filepath) as f:
+            return extractor(f)
+    except Exception as e:
+        print(f"[x] Could not read encrypted {filepath}: {str(e)}")
+        return dict(defaults)
+
+
+class LazyVariables(dict):
+    """Rule variables that read document metadata only when a rule asks for it"""
+
+    def __init__(self, filepath, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.filepath = filepath
+
+    def _resolve(self, name):
+        if name in LAZY_RESOLVERS:
+            values = LAZY_RESOLVERS[name](self.filepath)
+        else:
+            filetype = METADATA_VARIABLES[name]
+            extractor, defaults = METADATA_EXTRACTORS[filetype]
+            if source_filetype(self.filepath) == filetype:
+                values = _extract(extractor, self.filepath, defaults)
+            else:
+                values = dict(defaults)
+        # One read fills in every variable of the group
+        for key, value in values.items():
+            self.setdefault(key, value)
+
+    def _is_lazy(self, name):
+        return name in METADATA_VARIABLES or name in LAZY_RESOLVERS
+
+    def __missing__(self, name):
+        if not self._is_lazy(name):
+            raise KeyError(name)
+        self._resolve(name)
+        return self[name]
+
+    def __contains__(self, name):
+        return super().__contains__(name) or self._is_lazy(name)
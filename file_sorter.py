@@ -2,18 +2,48 @@
 import os
 import re
 import json
-import shutil
-import requests
+import file_transfer
 from pathlib import Path
 from PIL import Image
+from file_metadata import LazyVariables
+from title_patterns import TitlePatternStore, normalize_title
+from variable_cache import VariableCache
+from model_manager import get_model_manager
+from classification_cache import get_classification_cache
+from name_allocator import get_name_allocator
+from metadata_index import get_metadata_index
+from encryption_index import get_encryption_index
+from dedup import dedupe_file
+from image_similarity import keep_best_of_burst, NEAR_DUPLICATE_RADIUS
+
+
+class RuleScope(dict):
+    """Globals for a rule condition that look names up in its variables on demand
+
+    Being globals rather than locals, the variables are also visible inside
+    comprehensions and lambdas, and lazy ones still resolve only when used.
+    """
+
+    def __init__(self, variables, env):
+        super().__init__(env)
+        self.variables = variables
+
+    def __missing__(self, name):
+        return self.variables[name]
+
 
 class FileSorter:
     def __init__(self):
         self.ollama_endpoint = "http://localhost:11434/api/generate"
+        self.models = get_model_manager()
         self.rules = self.load_rules() 
         self.categories = self.extract_categories_from_rules()
         self.variable_pattern = re.compile(r"{(\w+)}")
         self.temp_image_path = os.path.join(os.path.expanduser("~"), "temp_analysis.jpg")
+        self.title_patterns = TitlePatternStore()
+        self.variable_cache = VariableCache()
+        self.classification_cache = get_classification_cache()
+        self.metadata_index = get_metadata_index()
 
     def load_rules(self):
         """Load sorting rules from file"""
@@ -32,19 +62,26 @@ class FileSorter:
             categories.update(matches)
         return list(categories)
 
+    def classification_key(self, kind, process_name, window_title):
+        """Cache key for a model answer about a (process, window title) pair"""
+        return (kind, (process_name or '').lower(), normalize_title(window_title), tuple(sorted(self.categories)))
+
     def classify_application(self, process_name, window_title):
         """Classify application using AI"""
         prompt = (
             f"Classify this application ({process_name}) with window title '{window_title}' "
             f"into one of these categories: {self.categories}. Respond with only the category name. If no category fits, reply with 'Other'."
         )
+
+        def ask():
+            response = self.models.generate("mistral", {"prompt": prompt}, timeout=20)
+            return response.get("response", "other").strip().lower()
+
         try:
-            response = requests.post(
-                self.ollama_endpoint,
-                json={"model": "mistral", "prompt": prompt, "stream": False},
-                timeout=20
+            # May already be answered (or in flight) from speculative pre-classification
+            return self.classification_cache.get_or_compute(
+                self.classification_key('category', process_name, window_title), ask
             )
-            return response.json().get("response", "other").strip().lower()
         except Exception as e:
             print(f"Classification failed: {e}")
             return "other"
@@ -56,16 +93,15 @@ class FileSorter:
             with Image.open(image_path) as img:
                 img.convert("RGB").save(self.temp_image_path)
             
-            response = requests.post(
-                self.ollama_endpoint,
-                json={
-                    "model": "pixtral",
+            response = self.models.generate(
+                "pixtral",
+                {
                     "prompt": f"Categorize this image into one of: {self.categories}. Respond with only the category name.",
                     "images": [self.temp_image_path]
                 },
                 timeout=15
             )
-            return response.json().get("response", "other").strip().lower()
+            return response.get("response", "other").strip().lower()
         except Exception as e:
             print(f"Image analysis failed: {e}")
             return "other"
@@ -78,14 +114,23 @@ class FileSorter:
         variables = self.extract_variables(filepath, window_info)
         variables['category'] = self.determine_category(filepath, variables)
         
-        for rule in sorted(self.rules, key=lambda x: x.get('priority', 1), reverse=True):
-            if self.evaluate_rule(rule['condition'], variables):
-                self.execute_action(rule['action'], filepath, variables)
-                return True
+        rule = self.first_matching_rule(variables)
+        if rule:
+            self.execute_action(rule['action'], filepath, variables)
+            return True
         return False
 
+    def first_matching_rule(self, variables, rules=None):
+        """Return the highest-priority rule whose condition holds, or None"""
+        for rule in sorted(self.rules if rules is None else rules, key=lambda x: x.get('priority', 1), reverse=True):
+            if self.evaluate_rule(rule['condition'], variables):
+                return rule
+        return None
+
     def extract_variables(self, filepath, window_info):
         """Dynamically extract variables from multiple sources"""
+        # Fill in source-app details recorded by the monitor when not given
+        window_info = {**self.metadata_index.lookup(filepath), **window_info}
         base_vars = {
             'filename': os.path.basename(filepath),
             'filetype': os.path.splitext(filepath)[1][1:].lower(),
@@ -106,7 +151,8 @@ class FileSorter:
         # AI-powered variable extraction
         enhanced_vars = self.ai_extract_variables(filepath, window_info, required_vars)
         
-        return {**base_vars, **enhanced_vars}
+        # Document metadata (pdf_pages, doc_author, zip_members, ...) is read lazily
+        return LazyVariables(filepath, {**base_vars, **enhanced_vars})
 
     def ai_extract_variables(self, filepath, window_info, required_vars):
         """Use AI to fill missing template variables"""
@@ -114,7 +160,10 @@ class FileSorter:
         
         # Analyze window title for missing variables
         if 'game_name' in required_vars:
-            extracted['game_name'] = self.analyze_window_title(window_info.get('window_title', '')).lower()
+            extracted['game_name'] = self.analyze_window_title(
+                window_info.get('window_title', ''),
+                window_info.get('process_name', '')
+            ).lower()
         
         # Analyze image content for missing variables
         if 'content_type' in required_vars:
@@ -122,16 +171,25 @@ class FileSorter:
         
         return extracted
 
-    def analyze_window_title(self, title):
+    def analyze_window_title(self, title, process_name=''):
         """Extract structured data from window titles"""
+        # Known processes and title layouts are answered without the model
+        game_name = self.title_patterns.lookup(process_name, title)
+        if game_name:
+            return game_name
+
         prompt = f"Extract game name from this window title: '{title}'. Respond only with the name."
+
+        def ask():
+            response = self.models.generate("mistral", {"prompt": prompt}, timeout=10)
+            game_name = response.get("response", "").strip().lower()
+            self.title_patterns.learn(process_name, title, game_name)
+            return game_name
+
         try:
-            response = requests.post(
-                self.ollama_endpoint,
-                json={"model": "mistral", "prompt": prompt, "stream": False},
-                timeout=10
+            return self.classification_cache.get_or_compute(
+                self.classification_key('game_name', process_name, title), ask
             )
-            return response.json().get("response", "").strip().lower()
         except Exception as e:
             print(f"Title analysis failed: {e}")
             return ""
@@ -146,13 +204,12 @@ class FileSorter:
         """Safely evaluate rule conditions"""
         try:
             # Create safe evaluation environment
-            safe_env = {
-                **variables,
+            safe_env = RuleScope(variables, {
                 "__builtins__": None,
                 "True": True,
                 "False": False,
                 "None": None
-            }
+            })
             return eval(condition, safe_env)
         except Exception as e:
             print(f"Rule evaluation failed: {str(e)}")
@@ -161,19 +218,30 @@ class FileSorter:
    # In execute_action method
     def execute_action(self, action, filepath, variables):
         """Execute file operation with directory handling"""
-        template = action.get('target_path', '')
-        
-        # Force include filename if missing
-        if not any(p in template for p in ['{filename}', '{file_name}']):
-            template = os.path.join(template, '{filename}')
-        
-        # Resolve target path
-        target_path = self.resolve_template(template, variables)
+        # Variables already resolved by decide_action are never regenerated
+        variables.update(action.get('variables', {}))
+
+        if action.get('target'):
+            target_path = action['target']
+        else:
+            template = action.get('target_path', '')
+            
+            # Force include filename if missing
+            if not any(p in template for p in ['{filename}', '{file_name}']):
+                template = os.path.join(template, '{filename}')
+            
+            # Resolve target path
+            target_path = self.resolve_template(template, variables)
         
         if action['type'] == 'move':
             self.move_file(filepath, target_path)
         elif action['type'] == 'copy':
-            self.copy_file(filepath, target_path)
+            self.copy_file(filepath, target_path, action.get('mode', 'copy'))
+        elif action['type'] == 'dedupe':
+            if variables['is_duplicate']:
+                dedupe_file(filepath, variables['duplicate_of'], action.get('mode', 'delete'))
+        elif action['type'] == 'keep_best':
+            keep_best_of_burst(filepath, action.get('radius', NEAR_DUPLICATE_RADIUS))
         else:
             print(f"Unsupported action type: {action['type']}")
 
@@ -183,11 +251,12 @@ class FileSorter:
         required_vars = set(self.variable_pattern.findall(template))
         
         # Generate missing variables through AI
-        for var in required_vars - variables.keys():
-            variables[var] = self.ai_generate_variable(var, variables)
+        for var in required_vars:
+            if var not in variables:
+                variables[var] = self.generate_variable(var, variables)
         
         # Validate after AI generation
-        missing = required_vars - variables.keys()
+        missing = {var for var in required_vars if var not in variables}
         if missing:
             raise ValueError(f"Missing variables after AI analysis: {missing}")
         
@@ -196,6 +265,17 @@ class FileSorter:
             template
         )
 
+    def generate_variable(self, var_name, context):
+        """Return a memoized variable, asking the AI only on a cache miss"""
+        source_app = context.get('source_app', '')
+        window_title = context.get('window_title', '')
+        filename = context.get('filename', '')
+        value = self.variable_cache.get(var_name, source_app, window_title, filename)
+        if value is None:
+            value = self.ai_generate_variable(var_name, context)
+            self.variable_cache.put(var_name, source_app, window_title, value, filename)
+        return value
+
     def ai_generate_variable(self, var_name, context):
         """Generate missing variables using AI"""
         prompt = f"""Based on this file context:
@@ -205,50 +285,57 @@ class FileSorter:
         Generate appropriate value for {var_name}. Respond only with the value."""
         
         try:
-            response = requests.post(
-                self.ollama_endpoint,
-                json={"model": "mistral", "prompt": prompt, "stream": False},
-                timeout=15
-            )
-            return response.json().get("response", "").strip()
+            response = self.models.generate("mistral", {"prompt": prompt}, timeout=15)
+            return response.get("response", "").strip()
         except Exception as e:
             print(f"AI variable generation failed: {e}")
             return ""
 
 
-    def move_file(self, src, dest):
+    def move_file(self, src, dest, on_claim=None):
         """Move file with conflict resolution"""
-        return self._file_operation(src, dest, shutil.move)
+        return self._file_operation(src, dest, file_transfer.move, on_claim)
 
-    def copy_file(self, src, dest):
-        """Copy file with conflict resolution"""
-        return self._file_operation(src, dest, shutil.copy)
+    def copy_file(self, src, dest, mode='copy', on_claim=None):
+        """Copy file with conflict resolution (mode: copy, reflink, hardlink or auto)"""
+        return self._file_operation(src, dest, lambda s, d: file_transfer.copy(s, d, mode), on_claim)
 
-    def _file_operation(self, src, dest, operation):
-        """Handle directory creation and conflict resolution"""
+    def _file_operation(self, src, dest, operation, on_claim=None):
+        """Handle directory creation and conflict resolution
+
+        on_claim(path) is called with the claimed destination before anything
+        is written to it, so a journal can find the placeholder after a crash.
+        """
         # Ensure destination is always a file path
         if os.path.isdir(dest):
             dest = os.path.join(dest, os.path.basename(src))
 
         dest_dir = os.path.dirname(dest)
-        filename = os.path.basename(dest)
         
         # Ensure parent directory exists
         os.makedirs(dest_dir, exist_ok=True)
         
-        # Conflict resolution
-        base, ext = os.path.splitext(filename)
-        counter = 1
-        new_dest = dest
-        
-        while os.path.exists(new_dest):
-            new_filename = f"{base}_{counter}{ext}"
-            new_dest = os.path.join(dest_dir, new_filename)
-            counter += 1
+        # Conflict resolution: claim a free name (base, base_1, ...) atomically
+        allocator = get_name_allocator()
+        new_dest = allocator.claim(dest)
+        if on_claim:
+            on_claim(new_dest)
         
-        # Perform operation
-        operation(src, new_dest)
-        print(f"Processed {os.path.basename(src)} -> {new_dest}")
+        metadata = self.metadata_index.lookup(src)
+
+        # Perform operation over the claimed placeholder
+        try:
+            operation(src, new_dest)
+        except Exception:
+            allocator.release(new_dest)
+            raise
+
+        # Re-key the source-app metadata to the file's new identity
+        if metadata:
+            self.metadata_index.record(new_dest, metadata['process_name'], metadata['window_title'])
+        # Ciphertext stays findable by key rotation wherever it goes
+        if new_dest.endswith('.encrypted'):
+            get_encryption_index().track(new_dest)
         return new_dest
 
 
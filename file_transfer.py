@@ -0,0 +1,145 @@
+# file_transfer.py
+import os
+import sys
+import time
+import errno
+import shutil
+
+COPY_CHUNK = 64 * 1024 * 1024      # per kernel copy call
+COPY_BUFFER = 1024 * 1024          # userspace fallback buffer
+FICLONE = 0x40049409               # Linux reflink ioctl (btrfs, xfs, ...)
+ERROR_NOT_SAME_DEVICE = 17         # Windows
+
+COPY_MODES = ('copy', 'reflink', 'hardlink', 'auto')
+
+
+def _is_cross_device(error):
+    return error.errno == errno.EXDEV or getattr(error, 'winerror', None) == ERROR_NOT_SAME_DEVICE
+
+
+def device_of(path):
+    """st_dev of the nearest existing ancestor of path"""
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    try:
+        return os.stat(path).st_dev
+    except OSError:
+        return None
+
+
+def _report(method, src, dest, size, started):
+    elapsed = max(time.perf_counter() - started, 1e-6)
+    result = {'method': method, 'bytes': size, 'seconds': elapsed, 'bytes_per_sec': size / elapsed}
+    print(f"[✓] {method} {os.path.basename(src)} -> {dest} "
+          f"({size / 1e6:.1f} MB at {result['bytes_per_sec'] / 1e6:.1f} MB/s)")
+    return result
+
+
+def _kernel_copy(fsrc, fdst, size):
+    """Copy between open files without pulling the bytes through Python"""
+    in_fd, out_fd = fsrc.fileno(), fdst.fileno()
+
+    if hasattr(os, 'copy_file_range'):
+        copied = 0
+        try:
+            while copied < size:
+                sent = os.copy_file_range(in_fd, out_fd, min(COPY_CHUNK, size - copied))
+                if sent == 0:
+                    break
+                copied += sent
+            return 'copy_file_range'
+        except OSError as e:
+            # Older kernels refuse cross-filesystem ranges; fall through if untouched
+            if copied or e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+
+    if hasattr(os, 'sendfile') and sys.platform.startswith('linux'):
+        offset = 0
+        while offset < size:
+            sent = os.sendfile(out_fd, in_fd, offset, min(COPY_CHUNK, size - offset))
+            if sent == 0:
+                break
+            offset += sent
+        return 'sendfile'
+
+    shutil.copyfileobj(fsrc, fdst, COPY_BUFFER)
+    return 'buffered copy'
+
+
+def _reflink(fsrc, fdst):
+    import fcntl
+    fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    return 'reflink'
+
+
+def _temp_path(dest):
+    dest_dir, name = os.path.split(dest)
+    return os.path.join(dest_dir, f".{name}.{os.getpid()}.part")
+
+
+def _copy_data(src, dest, reflink=False):
+    """Copy src into a temp file next to dest, then swap it into place"""
+    temp = _temp_path(dest)
+    try:
+        with open(src, 'rb') as fsrc, open(temp, 'wb') as fdst:
+            size = os.fstat(fsrc.fileno()).st_size
+            method = None
+            if reflink:
+                try:
+                    method = _reflink(fsrc, fdst)
+                except (ImportError, OSError):
+                    method = None
+            if method is None:
+                method = _kernel_copy(fsrc, fdst, size)
+        shutil.copystat(src, temp)
+        os.replace(temp, dest)
+        return method, size
+    except BaseException:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+
+
+def move(src, dest):
+    """Move a file: atomic rename on the same device, kernel copy across devices"""
+    started = time.perf_counter()
+    size = os.path.getsize(src)
+    try:
+        os.replace(src, dest)
+        return _report('rename', src, dest, size, started)
+    except OSError as e:
+        if not _is_cross_device(e) or os.path.isdir(src):
+            raise
+
+    method, size = _copy_data(src, dest)
+    os.remove(src)
+    return _report(f"move via {method}", src, dest, size, started)
+
+
+def copy(src, dest, mode='copy'):
+    """Copy a file, optionally sharing blocks (reflink) or the inode (hardlink)
+
+    'auto' tries a reflink and falls back to a regular kernel copy. A hardlink
+    that the filesystem refuses (different volume, FAT, ...) also falls back.
+    """
+    if mode not in COPY_MODES:
+        raise ValueError(f"Unsupported copy mode: {mode}")
+    started = time.perf_counter()
+
+    if mode == 'hardlink':
+        temp = _temp_path(dest)
+        try:
+            os.link(src, temp)
+            os.replace(temp, dest)
+            return _report('hardlink', src, dest, os.path.getsize(dest), started)
+        except OSError as e:
+            if os.path.exists(temp):
+                os.remove(temp)
+            print(f"[!] Hardlink unavailable ({str(e)}), copying instead")
+
+    method, size = _copy_data(src, dest, reflink=mode in ('reflink', 'auto'))
+    return _report(method, src, dest, size, started)
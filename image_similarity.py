@@ -0,0 +1,305 @@
+# image_similarity.py
+import os
+import json
+import threading
+from itertools import combinations
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+from file_metadata import register_lazy_variables
+
+IMAGE_HASH_FILE = 'image_hashes.json'
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'bmp', 'webp', 'gif'}
+# Hamming distance (of 64 bits) under which two frames count as one burst
+NEAR_DUPLICATE_RADIUS = 6
+# Frames further apart in time than this are separate shots, however alike
+BURST_WINDOW = 30  # seconds
+CHUNKS = 8            # 8-bit substrings for multi-index hashing
+HASH_WORKERS = 4
+SHARPNESS_SIZE = 512  # frames are downscaled to this before scoring
+
+
+def is_image(path):
+    return os.path.splitext(path)[1][1:].lower() in IMAGE_EXTENSIONS
+
+
+def _bits_to_int(bits):
+    value = 0
+    for bit in np.asarray(bits, dtype=bool).ravel():
+        value = (value << 1) | int(bit)
+    return value
+
+
+def dhash(image_path):
+    """64-bit difference hash: is each pixel brighter than its right neighbour"""
+    with Image.open(image_path) as img:
+        small = img.convert('L').resize((9, 8), Image.LANCZOS)
+    pixels = np.asarray(small, dtype=np.int16)
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+_DCT = None
+
+
+def _dct_matrix(n=32):
+    global _DCT
+    if _DCT is None:
+        k = np.arange(n)[:, None]
+        i = np.arange(n)[None, :]
+        matrix = np.sqrt(2.0 / n) * np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+        matrix[0] /= np.sqrt(2.0)
+        _DCT = matrix
+    return _DCT
+
+
+def phash(image_path):
+    """64-bit DCT hash: low frequencies above/below their median"""
+    with Image.open(image_path) as img:
+        small = img.convert('L').resize((32, 32), Image.LANCZOS)
+    dct = _dct_matrix(32)
+    coefficients = dct @ np.asarray(small, dtype=np.float64) @ dct.T
+    low = coefficients[:8, :8].ravel()
+    return _bits_to_int(low > np.median(low[1:]))
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+def sharpness(image_path):
+    """Variance of the Laplacian: higher means a crisper frame"""
+    with Image.open(image_path) as img:
+        gray = img.convert('L')
+        gray.thumbnail((SHARPNESS_SIZE, SHARPNESS_SIZE))
+    px = np.asarray(gray, dtype=np.float64)
+    if px.shape[0] < 3 or px.shape[1] < 3:
+        return 0.0
+    laplacian = (px[:-2, 1:-1] + px[2:, 1:-1] + px[1:-1, :-2] + px[1:-1, 2:] - 4 * px[1:-1, 1:-1])
+    return float(laplacian.var())
+
+
+class MultiIndexHashTable:
+    """Hamming-radius search over 64-bit hashes without comparing against every entry
+
+    Each hash is split into CHUNKS substrings with one table per substring.
+    Two hashes within radius r must agree to within r // CHUNKS bits on at
+    least one substring (pigeonhole), so only those buckets are examined.
+    """
+
+    def __init__(self, chunks=CHUNKS):
+        self.chunks = chunks
+        self.bits = 64 // chunks
+        self.tables = [{} for _ in range(chunks)]
+        self.hashes = {}
+
+    def _parts(self, value):
+        mask = (1 << self.bits) - 1
+        return [(value >> (self.bits * i)) & mask for i in range(self.chunks)]
+
+    def _neighbours(self, part, radius):
+        yield part
+        for r in range(1, radius + 1):
+            for positions in combinations(range(self.bits), r):
+                flipped = part
+                for position in positions:
+                    flipped ^= 1 << position
+                yield flipped
+
+    def insert(self, key, value):
+        if key in self.hashes:
+            self.remove(key)
+        self.hashes[key] = value
+        for table, part in zip(self.tables, self._parts(value)):
+            table.setdefault(part, set()).add(key)
+
+    def remove(self, key):
+        value = self.hashes.pop(key, None)
+        if value is None:
+            return
+        for table, part in zip(self.tables, self._parts(value)):
+            bucket = table.get(part)
+            if bucket:
+                bucket.discard(key)
+                if not bucket:
+                    del table[part]
+
+    def query(self, value, radius):
+        """Return {key: distance} for every stored hash within radius"""
+        candidates = set()
+        for table, part in zip(self.tables, self._parts(value)):
+            for neighbour in self._neighbours(part, radius // self.chunks):
+                candidates.update(table.get(neighbour, ()))
+        matches = {}
+        for key in candidates:
+            distance = hamming(value, self.hashes[key])
+            if distance <= radius:
+                matches[key] = distance
+        return matches
+
+    def __len__(self):
+        return len(self.hashes)
+
+
+class PerceptualIndex:
+    """Persistent perceptual hashes of watched images with near-duplicate queries"""
+
+    def __init__(self, path=IMAGE_HASH_FILE, hash_function=dhash):
+        self.path = path
+        self.hash_function = hash_function
+        self.table = MultiIndexHashTable()
+        self.stamps = {}   # path -> (mtime_ns, size) the hash was computed for
+        self.dirty = False
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=HASH_WORKERS)
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                stored = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            stored = {}
+        with self._lock:
+            for image_path, (value, mtime_ns, size) in stored.items():
+                self.table.insert(image_path, int(value, 16))
+                self.stamps[image_path] = (mtime_ns, size)
+
+    def save(self):
+        """Persist hashes (called periodically, not on every insert)"""
+        with self._lock:
+            if not self.dirty:
+                return
+            stored = {
+                image_path: [format(value, '016x'), *self.stamps[image_path]]
+                for image_path, value in self.table.hashes.items()
+            }
+            self.dirty = False
+        try:
+            with open(self.path, 'w') as f:
+                json.dump(stored, f)
+        except Exception as e:
+            print(f"[x] Failed to save image hashes: {str(e)}")
+
+    def ensure(self, image_path):
+        """Hash image_path if it is new or changed; returns its hash or None"""
+        if not is_image(image_path):
+            return None
+        image_path = os.path.abspath(image_path)
+        try:
+            st = os.stat(image_path)
+            stamp = (st.st_mtime_ns, st.st_size)
+            with self._lock:
+                if self.stamps.get(image_path) == stamp:
+                    return self.table.hashes[image_path]
+            value = self.hash_function(image_path)
+        except Exception as e:
+            print(f"[x] Perceptual hash failed for {image_path}: {str(e)}")
+            return None
+        with self._lock:
+            self.table.insert(image_path, value)
+            self.stamps[image_path] = stamp
+            self.dirty = True
+        return value
+
+    def remove(self, image_path):
+        image_path = os.path.abspath(image_path)
+        with self._lock:
+            if image_path in self.stamps:
+                self.table.remove(image_path)
+                del self.stamps[image_path]
+                self.dirty = True
+
+    def add_folder(self, folder):
+        """Hash a folder's images in the background; unchanged ones are skipped"""
+        try:
+            with os.scandir(folder) as entries:
+                paths = [entry.path for entry in entries if entry.is_file() and is_image(entry.name)]
+        except OSError as e:
+            print(f"[x] Image scan failed for {folder}: {str(e)}")
+            return
+        for image_path in paths:
+            self._pool.submit(self.ensure, image_path)
+
+    def near_duplicates(self, image_path, radius=NEAR_DUPLICATE_RADIUS):
+        """Other images within radius of image_path"""
+        image_path = os.path.abspath(image_path)
+        value = self.ensure(image_path)
+        if value is None:
+            return []
+        with self._lock:
+            matches = self.table.query(value, radius)
+        return [other for other in matches if other != image_path and os.path.exists(other)]
+
+    def cluster(self, image_path, radius=NEAR_DUPLICATE_RADIUS, window=BURST_WINDOW):
+        """The burst image_path belongs to: frames within radius of it and window seconds of its mtime
+
+        Distances are measured to image_path itself, not hopped through
+        neighbours, so a long run of slowly changing screenshots never
+        chains into one burst.
+        """
+        image_path = os.path.abspath(image_path)
+        seed_mtime = os.path.getmtime(image_path)
+        burst = [image_path]
+        for other in self.near_duplicates(image_path, radius):
+            try:
+                if abs(os.path.getmtime(other) - seed_mtime) <= window:
+                    burst.append(other)
+            except OSError:
+                continue
+        return sorted(burst)
+
+    def variables(self, image_path):
+        try:
+            count = len(self.cluster(image_path)) - 1
+        except OSError:
+            count = 0
+        return {'near_duplicate_count': count}
+
+
+# keep_best tasks for frames of one burst run side by side in the executor
+_burst_lock = threading.Lock()
+
+
+def keep_best_of_burst(image_path, radius=NEAR_DUPLICATE_RADIUS):
+    """Keep the sharpest (then largest) frame of image_path's burst and trash the rest"""
+    with _burst_lock:
+        return _keep_best(image_path, radius)
+
+
+def _keep_best(image_path, radius):
+    from file_deleter import delete_files
+    if not os.path.exists(image_path):
+        return None  # Already resolved as part of another frame's burst
+    index = get_perceptual_index()
+    burst = index.cluster(image_path, radius)
+    if len(burst) < 2:
+        return image_path
+
+    def score(path):
+        with Image.open(path) as img:
+            width, height = img.size
+        return sharpness(path), width * height, os.path.getsize(path)
+
+    scores = dict(zip(burst, index._pool.map(score, burst)))
+    best = max(burst, key=lambda path: scores[path])
+    others = [path for path in burst if path != best]
+    result = delete_files(others)
+    for path in result['deleted']:
+        index.remove(path)
+    print(f"[✓] Kept {os.path.basename(best)} from a burst of {len(burst)} "
+          f"({result['freed_bytes'] / 1e6:.1f} MB freed)")
+    return best
+
+
+_index = None
+
+
+def get_perceptual_index():
+    """Process-wide index; the monitor feeds it its watched folders"""
+    global _index
+    if _index is None:
+        _index = PerceptualIndex()
+    return _index
+
+
+register_lazy_variables(['near_duplicate_count'], lambda path: get_perceptual_index().variables(path))
@@ -0,0 +1,169 @@
+# key_rotation.py
+import os
+import json
+import shutil
+import time
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from cryptography.fernet import Fernet
+from file_crypto import (
+    get_keyring, key_id, header_key_id, is_stream_encrypted, open_encrypted, encrypt_stream,
+    read_stream_header, CHUNK_SIZE, ALG_AES_GCM, RETIRED_KEYS_FILE, CRYPTO_WORKERS
+)
+from encryption_index import get_encryption_index
+
+REENCRYPT_CHECKPOINT = 'reencrypt_checkpoint.json'
+REENCRYPT_LOCK = f"{REENCRYPT_CHECKPOINT}.lock"
+
+
+def rotate_key():
+    """Make a new current key and retire the old one; returns the new key
+
+    The old key is saved to the retired list before the key file is
+    replaced, so no file ever becomes unreadable. Run reencrypt_all (or
+    resume_reencryption) afterwards to move files onto the new key.
+    """
+    keyring = get_keyring()
+    old_key = keyring.key
+    retired = []
+    if os.path.exists(keyring.retired_path):
+        with open(keyring.retired_path, 'r') as f:
+            retired = json.load(f)
+    retired.append({'id': key_id(old_key).hex(), 'key': old_key.decode('ascii'),
+                    'retired': datetime.now().isoformat()})
+    with open(f"{keyring.retired_path}.tmp", 'w') as f:
+        json.dump(retired, f, indent=4)
+    os.replace(f"{keyring.retired_path}.tmp", keyring.retired_path)
+
+    new_key = Fernet.generate_key()
+    with open(f"{keyring.key_path}.tmp", 'wb') as f:
+        f.write(new_key)
+    os.replace(f"{keyring.key_path}.tmp", keyring.key_path)
+    keyring.reload()
+
+    _save_checkpoint(key_id(new_key).hex())
+    print(f"[✓] Rotated encryption key {key_id(old_key).hex()} -> {key_id(new_key).hex()}")
+    return new_key
+
+
+def _save_checkpoint(target):
+    with open(f"{REENCRYPT_CHECKPOINT}.tmp", 'w') as f:
+        json.dump({'target': target, 'started': datetime.now().isoformat()}, f, indent=4)
+    os.replace(f"{REENCRYPT_CHECKPOINT}.tmp", REENCRYPT_CHECKPOINT)
+
+
+@contextmanager
+def _reencryption_lock():
+    """Yields True if this process got the re-encryption lock, False if another holds it
+
+    The lock is an OS file lock, so it is released if its holder dies.
+    """
+    with open(REENCRYPT_LOCK, 'a+') as f:
+        try:
+            if os.name == 'nt':
+                import msvcrt
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        yield True
+
+
+def reencrypt_file(path, target=None):
+    """Re-seal one file under target (default the current key); returns False if it already was
+
+    Plaintext only ever exists in memory, a chunk at a time: the old file is
+    read through open_encrypted and sealed straight into a sibling temp
+    file, which then replaces the original in one rename.
+    """
+    target = target or get_keyring().key
+    target_id = key_id(target).hex()
+    if header_key_id(path) == target_id:
+        return False  # Swapped before an interruption, only the index is behind
+
+    chunk_size, algorithm = CHUNK_SIZE, ALG_AES_GCM
+    if is_stream_encrypted(path):
+        with open(path, 'rb') as f:
+            fields = read_stream_header(f)[1]
+        chunk_size, algorithm = fields['chunk_size'], fields['algorithm']
+
+    # A temp of our own; .rekey keeps the folder monitor off it
+    fd, temp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                prefix=f"{os.path.basename(path)}.", suffix='.rekey')
+    try:
+        with open_encrypted(path) as plain, os.fdopen(fd, 'wb') as out:
+            encrypt_stream(plain, out, target, chunk_size, algorithm)
+        shutil.copystat(path, temp)
+        os.replace(temp, path)
+    except BaseException:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+    return True
+
+
+def reencrypt_all(workers=CRYPTO_WORKERS):
+    """Move every indexed file onto the current key; returns (re-encrypted, failed)
+
+    The work list comes from the encryption index, largest files first, and
+    each file is marked done in the index as soon as it is swapped, so an
+    interrupted run picks up where it stopped. The checkpoint is only
+    cleared once the index shows nothing left on an old key; a file sealed
+    by another process before it saw the rotation keeps it in place.
+
+    Only one process re-encrypts at a time; a call made while another holds
+    the lock returns (0, 0) and leaves the work to it.
+    """
+    with _reencryption_lock() as locked:
+        if not locked:
+            print("[!] Re-encryption is already running in another process")
+            return 0, 0
+        return _reencrypt_all(workers)
+
+
+def _reencrypt_all(workers):
+    index = get_encryption_index()
+    target = get_keyring().key
+    target_id = key_id(target).hex()
+    _save_checkpoint(target_id)
+    pending = index.sealed_with_other_keys(target_id)
+    start, done, failed, total = time.perf_counter(), 0, 0, 0
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(reencrypt_file, path, target): path for path in pending if os.path.exists(path)}
+        for path in set(pending) - set(futures.values()):
+            index.forget(path)
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                future.result()
+                index.record(path, target_id)
+                total += os.path.getsize(path)
+                done += 1
+            except Exception as e:
+                print(f"[x] Re-encryption failed for {path}: {str(e)}")
+                failed += 1
+
+    elapsed = time.perf_counter() - start
+    print(f"[✓] Re-encrypted {done} files under key {target_id} "
+          f"({total / elapsed / 1e6 if elapsed > 0 else 0.0:.1f} MB/s), {failed} failed")
+    left = index.sealed_with_other_keys(target_id)
+    if left:
+        print(f"[!] {len(left)} files still on an old key; re-encryption will resume")
+    elif os.path.exists(REENCRYPT_CHECKPOINT):
+        os.remove(REENCRYPT_CHECKPOINT)
+    return done, failed
+
+
+def resume_reencryption(workers=CRYPTO_WORKERS):
+    """Finish a re-encryption that was interrupted; no-op if none is pending"""
+    if not os.path.exists(REENCRYPT_CHECKPOINT):
+        return None
+    print("[!] Resuming interrupted re-encryption")
+    return reencrypt_all(workers)
@@ -0,0 +1,164 @@
+# metadata_index.py
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+METADATA_DB = 'file_metadata.db'
+XATTR_PREFIX = 'user.declutter.'
+FIELDS = ('process_name', 'window_title')
+
+
+def _identity(path):
+    """(device, inode, mtime) - survives renames, unlike the path"""
+    st = os.stat(path)
+    return st.st_dev, st.st_ino, st.st_mtime_ns
+
+
+class MetadataIndex:
+    """Source-app metadata kept beside files instead of in their names
+
+    Values are written as extended attributes where the filesystem supports
+    them (they travel with the file, and copystat carries them across
+    copies), and always indexed in SQLite keyed by file identity so lookups
+    work on any platform and the GUI can query them.
+    """
+
+    def __init__(self, db_path=METADATA_DB):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        with self._connect() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS file_metadata (
+                    dev INTEGER, ino INTEGER, mtime_ns INTEGER, path TEXT,
+                    process_name TEXT, window_title TEXT, recorded TEXT,
+                    PRIMARY KEY (dev, ino)
+                )""")
+            db.execute("CREATE INDEX IF NOT EXISTS idx_file_metadata_path ON file_metadata(path)")
+            # The delete rule a file matched when it arrived, so sweeps never re-classify it
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS file_retention (
+                    dev INTEGER, ino INTEGER, mtime_ns INTEGER, path TEXT,
+                    condition TEXT, max_age REAL, disposable INTEGER, recorded TEXT,
+                    PRIMARY KEY (dev, ino)
+                )""")
+            db.execute("CREATE INDEX IF NOT EXISTS idx_file_retention_recorded ON file_retention(recorded)")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    @staticmethod
+    def _write_xattrs(path, metadata):
+        if not hasattr(os, 'setxattr'):
+            return False
+        try:
+            for field in FIELDS:
+                os.setxattr(path, XATTR_PREFIX + field, (metadata.get(field) or '').encode('utf-8'))
+            return True
+        except OSError:
+            return False  # FAT, network shares, ...
+
+    @staticmethod
+    def _read_xattrs(path):
+        if not hasattr(os, 'getxattr'):
+            return {}
+        try:
+            return {field: os.getxattr(path, XATTR_PREFIX + field).decode('utf-8') for field in FIELDS}
+        except OSError:
+            return {}
+
+    def record(self, path, process_name, window_title):
+        """Attach source-app metadata to path"""
+        metadata = {'process_name': process_name, 'window_title': window_title}
+        try:
+            self._write_xattrs(path, metadata)
+            dev, ino, mtime_ns = _identity(path)
+            with self._lock, self._connect() as db:
+                db.execute(
+                    "INSERT OR REPLACE INTO file_metadata VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (dev, ino, mtime_ns, os.path.abspath(path), process_name, window_title,
+                     datetime.now().isoformat())
+                )
+        except Exception as e:
+            print(f"[x] Failed to record metadata for {path}: {str(e)}")
+
+    def lookup(self, path):
+        """Return {'process_name', 'window_title'} for path, or {} if unknown"""
+        metadata = self._read_xattrs(path)
+        if metadata:
+            return metadata
+        try:
+            dev, ino, mtime_ns = _identity(path)
+            with self._lock, self._connect() as db:
+                row = db.execute(
+                    "SELECT process_name, window_title, mtime_ns, path FROM file_metadata "
+                    "WHERE dev = ? AND ino = ?", (dev, ino)
+                ).fetchone()
+        except Exception:
+            return {}
+        # A recycled inode belongs to a different file
+        if row and (row[2] == mtime_ns or row[3] == os.path.abspath(path)):
+            return {'process_name': row[0], 'window_title': row[1]}
+        return {}
+
+    def record_retention(self, path, condition, max_age, disposable):
+        """Remember that path fell under the delete rule `condition` (max_age in seconds)"""
+        try:
+            dev, ino, mtime_ns = _identity(path)
+            with self._lock, self._connect() as db:
+                db.execute(
+                    "INSERT OR REPLACE INTO file_retention VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (dev, ino, mtime_ns, os.path.abspath(path), condition, max_age, int(disposable),
+                     datetime.now().isoformat())
+                )
+        except Exception as e:
+            print(f"[x] Failed to record retention for {path}: {str(e)}")
+
+    def retention(self, path):
+        """{'condition', 'max_age', 'disposable'} recorded for path, or None"""
+        try:
+            dev, ino, mtime_ns = _identity(path)
+            with self._lock, self._connect() as db:
+                row = db.execute(
+                    "SELECT condition, max_age, disposable, mtime_ns, path FROM file_retention "
+                    "WHERE dev = ? AND ino = ?", (dev, ino)
+                ).fetchone()
+        except Exception:
+            return None
+        if row and (row[3] == mtime_ns or row[4] == os.path.abspath(path)):
+            return {'condition': row[0], 'max_age': row[1], 'disposable': bool(row[2])}
+        return None
+
+    def retention_since(self, recorded):
+        """[(path, disposable, recorded)] for retention recorded after `recorded`, oldest first"""
+        try:
+            with self._lock, self._connect() as db:
+                return [(path, bool(disposable), when) for path, disposable, when in db.execute(
+                    "SELECT path, disposable, recorded FROM file_retention WHERE recorded > ? "
+                    "ORDER BY recorded", (recorded,)
+                )]
+        except Exception as e:
+            print(f"[x] Failed to read recorded retention: {str(e)}")
+            return []
+
+    def prune(self):
+        """Drop rows for files that no longer exist at their recorded path"""
+        stale = 0
+        with self._lock, self._connect() as db:
+            for table in ('file_metadata', 'file_retention'):
+                rows = db.execute(f"SELECT dev, ino, path FROM {table}").fetchall()
+                gone = [(dev, ino) for dev, ino, path in rows if not os.path.exists(path)]
+                db.executemany(f"DELETE FROM {table} WHERE dev = ? AND ino = ?", gone)
+                stale += len(gone)
+        return stale
+
+
+_index = None
+
+
+def get_metadata_index():
+    """Process-wide index shared by the monitor, sorter and GUI"""
+    global _index
+    if _index is None:
+        _index = MetadataIndex()
+    return _index
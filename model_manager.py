@@ -0,0 +1,136 @@
+# model_manager.py
+import re
+import time
+import threading
+import requests
+from collections import Counter
+
+OLLAMA_ENDPOINT = "http://localhost:11434/api/generate"
+
+# How long Ollama keeps each model resident after its last call
+MODEL_KEEP_ALIVE = {
+    'mistral': '30m',
+    'pixtral': '10m',
+}
+DEFAULT_KEEP_ALIVE = '5m'
+
+# A call whose load_duration exceeds this paid for loading the model
+COLD_LOAD_THRESHOLD = 0.5
+# Consecutive calls granted to the resident model before others get a turn
+MAX_BATCH = 8
+
+
+class ModelManager:
+    """Serialises Ollama calls, favouring the resident model to avoid swaps"""
+
+    def __init__(self, endpoint=OLLAMA_ENDPOINT, keep_alive=None):
+        self.endpoint = endpoint
+        self.keep_alive = {**MODEL_KEEP_ALIVE, **(keep_alive or {})}
+        self.resident = None
+        self.stats = {}
+        self._cond = threading.Condition()
+        self._busy = False
+        self._streak = 0
+        self._waiting = Counter()
+
+    def keep_alive_for(self, model):
+        return self.keep_alive.get(model, DEFAULT_KEEP_ALIVE)
+
+    def _acquire(self, model):
+        with self._cond:
+            self._waiting[model] += 1
+            # Wait while another call runs, or while the resident model still
+            # has queued work and has not used up its batch
+            while self._busy or (
+                self.resident not in (None, model)
+                and self._waiting[self.resident] > 0
+                and self._streak < MAX_BATCH
+            ):
+                self._cond.wait()
+            self._waiting[model] -= 1
+            self._busy = True
+            if model != self.resident:
+                self.resident = model
+                self._streak = 0
+            self._streak += 1
+
+    def _release(self):
+        with self._cond:
+            self._busy = False
+            self._cond.notify_all()
+
+    def _record(self, model, elapsed, cold):
+        kind = 'cold' if cold else 'warm'
+        entry = self.stats.setdefault(model, {
+            'cold': {'calls': 0, 'seconds': 0.0},
+            'warm': {'calls': 0, 'seconds': 0.0},
+        })
+        entry[kind]['calls'] += 1
+        entry[kind]['seconds'] += elapsed
+
+    def generate(self, model, payload, timeout):
+        """POST a generate request for model and return the decoded response"""
+        body = {'stream': False, **payload, 'model': model, 'keep_alive': self.keep_alive_for(model)}
+        self._acquire(model)
+        try:
+            start = time.perf_counter()
+            response = requests.post(self.endpoint, json=body, timeout=timeout)
+            elapsed = time.perf_counter() - start
+            data = response.json()
+            load_seconds = data.get('load_duration', 0) / 1e9
+            self._record(model, elapsed, load_seconds > COLD_LOAD_THRESHOLD)
+            return data
+        finally:
+            self._release()
+
+    def preload(self, models):
+        """Load models ahead of the first real call (a request without a prompt)"""
+        for model in models:
+            try:
+                start = time.perf_counter()
+                self.generate(model, {}, timeout=120)
+                print(f"[✓] Preloaded {model} in {time.perf_counter() - start:.1f}s "
+                      f"(keep-alive {self.keep_alive_for(model)})")
+            except Exception as e:
+                print(f"[x] Failed to preload {model}: {str(e)}")
+
+    def preload_async(self, models):
+        thread = threading.Thread(target=self.preload, args=(list(models),), daemon=True)
+        thread.start()
+        return thread
+
+    def report(self):
+        """Print cold versus warm call latency per model"""
+        for model, entry in sorted(self.stats.items()):
+            parts = []
+            for kind in ('cold', 'warm'):
+                calls, seconds = entry[kind]['calls'], entry[kind]['seconds']
+                average = seconds / calls if calls else 0.0
+                parts.append(f"{kind} {calls} calls avg {average:.2f}s")
+            print(f"[!] {model}: {', '.join(parts)}")
+
+
+def required_models(rules, categories):
+    """Work out which models the current rules will actually call"""
+    text = ' '.join(
+        f"{rule.get('condition', '')} {rule.get('action', {}).get('target_path', '')}"
+        for rule in rules
+    )
+    models = []
+    # Image analysis runs for browser screenshots and {content_type} templates
+    if 'browser' in categories or re.search(r"\bcontent_type\b", text):
+        models.append('pixtral')
+    # classify_application runs for every file; load it last so it stays resident
+    models.append('mistral')
+    return models
+
+
+_manager = None
+
+
+def get_model_manager():
+    """Process-wide manager shared by every FileSorter"""
+    global _manager
+    if _manager is None:
+        _manager = ModelManager()
+    return _manager
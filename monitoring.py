@@ -5,16 +5,34 @@ import win32gui
 import win32process
 import psutil
 import json
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from watchdog.observers import Observer 
 from watchdog.events import FileSystemEventHandler
-from next_action import get_next_action
-from file_deleter import delete_file
+from next_action import get_next_action, pending_record, queue_entry
+from file_deleter import delete_files, parse_schedule_entry
 from datetime import datetime, timedelta
 from apscheduler.schedulers.background import BackgroundScheduler
 from compress_extract import compress_file,extract_file
 from file_crypto import encrypt_file
+from key_rotation import resume_reencryption
+from file_sorter import FileSorter
+from model_manager import get_model_manager, required_models
+from metadata_index import get_metadata_index
+from retention import RetentionSweeper, get_inventory, find_inventory, parse_time_delta
+from space_pressure import SpacePressureEvictor
+from dedup import get_dedup_index
+from image_similarity import get_perceptual_index, is_image
 processed_files = set()
+evictor = None
+# Content hashing of new files, kept off the watchdog event thread
+content_indexer = ThreadPoolExecutor(max_workers=1)
+# Embed _APP-/_TITLE- tags in filenames as well as the metadata index
+TAG_FILENAMES = False
+# Work files the app writes beside their final name and renames into place
+TEMP_SUFFIXES = ('.part', '.rekey')
 
 # Add near the top of monitoring.py
 def load_processed_files():
@@ -40,19 +58,26 @@ def check_scheduled_deletions():
     except (FileNotFoundError, json.JSONDecodeError):
         return "error"
 
-    deleted_files = []
+    due = {False: [], True: []}
     
-    for filepath, date_str in scheduled.items():
+    for filepath, entry in scheduled.items():
         try:
-            deletion_date = datetime.fromisoformat(date_str)
+            deletion_date, disposable = parse_schedule_entry(entry)
             if now >= deletion_date:
-                if delete_file(filepath):
-                    deleted_files.append(filepath)
+                due[disposable].append(filepath)
         except Exception as e:
             print(f"[x] Error processing {filepath}: {str(e)}")
     
+    # One batch per tier: recycle bin, and direct unlink for disposable files
+    deleted_files = []
+    for disposable, paths in due.items():
+        if paths:
+            deleted_files.extend(delete_files(paths, disposable=disposable)['deleted'])
+            # Files that vanished on their own no longer need a schedule entry
+            deleted_files.extend(path for path in paths if not os.path.exists(path))
+    
     # Update schedule file
-    for filepath in deleted_files:
+    for filepath in set(deleted_files):
         del scheduled[filepath]
     
     with open('files_to_be_deleted.txt', 'w') as f:
@@ -71,28 +96,92 @@ def get_active_window_info():
     except psutil.NoSuchProcess:
         return {'process_name': 'unknown', 'window_title': ''}
     
-from datetime import timedelta
+SPECULATION_POLL_INTERVAL = 0.5  # seconds between foreground checks
+SPECULATION_DWELL = 1.0          # focus time before a window is worth classifying
+SPECULATION_MAX_PER_MINUTE = 12
 
-def parse_time_delta(time_str):
-    value, unit = time_str.split()
-    value = int(value)
-    
-    # Normalize unit by stripping trailing 's' if it's plural
-    unit = unit.lower().rstrip('s')
-    
-    # Map normalized unit to timedelta argument
-    unit_map = { 
-        'day': 'days',
-        'hour': 'hours',
-        'minute': 'minutes',
-        'second': 'seconds'
-    }
-    
-    if unit not in unit_map:
-        raise ValueError(f"Unsupported time unit: {unit}")
-    
-    return timedelta(**{unit_map[unit]: value})
 
+class ForegroundSpeculator:
+    """Pre-classify the focused window so files it produces are already categorised"""
+
+    def __init__(self):
+        self.sorter = FileSorter()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = []
+        self.recent = deque()
+        self.current = None
+        self.focused_since = 0.0
+        self.submitted = None
+        self._stop = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        print("[✓] Speculative pre-classification started", flush=True)
+
+    def stop(self):
+        self._stop.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self):
+        while not self._stop.wait(SPECULATION_POLL_INTERVAL):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"[x] Foreground check failed: {str(e)}")
+
+    def poll(self):
+        info = get_active_window_info()
+        pair = (info['process_name'], info['window_title'])
+        now = time.monotonic()
+
+        if pair != self.current:
+            # Focus changed; wait for it to settle before spending a model call
+            self.current, self.focused_since = pair, now
+            return
+        if pair == self.submitted or now - self.focused_since < SPECULATION_DWELL:
+            return
+        if pair[0] == 'unknown':
+            return
+        self.submitted = pair
+        self.speculate(*pair, now)
+
+    def _needs_game_name(self):
+        return any(
+            'game_name' in rule.get('condition', '') or
+            'game_name' in rule.get('action', {}).get('target_path', '')
+            for rule in self.sorter.rules
+        )
+
+    def speculate(self, process_name, window_title, now):
+        # Work queued for windows that have since lost focus is no longer needed
+        for future in self.pending:
+            future.cancel()
+        self.pending = [self.executor.submit(self._classify, process_name, window_title, now)]
+
+    def _classify(self, process_name, window_title, now):
+        """Runs on the executor's single thread, the only one that touches self.sorter"""
+        pair = (process_name, window_title)
+        if self.current != pair:
+            return
+        # Pick up rule edits so cache keys match what FileHandler will look up
+        self.sorter.rules = self.sorter.load_rules()
+        self.sorter.categories = self.sorter.extract_categories_from_rules()
+        self.sorter.title_patterns.load()
+
+        cache = self.sorter.classification_cache
+        if cache.contains(self.sorter.classification_key('category', process_name, window_title)):
+            return
+
+        while self.recent and now - self.recent[0] > 60:
+            self.recent.popleft()
+        if len(self.recent) >= SPECULATION_MAX_PER_MINUTE:
+            return
+        self.recent.append(now)
+
+        category = self.sorter.classify_application(process_name, window_title)
+        if self.current == pair and self._needs_game_name():
+            self.sorter.analyze_window_title(window_title, process_name)
+        print(f"[✓] Pre-classified {process_name} as {category}")
 
 
 class FileHandler(FileSystemEventHandler):
@@ -102,11 +191,12 @@ class FileHandler(FileSystemEventHandler):
 
             filepath = event.src_path
 
-            if filepath in processed_files:
+            if filepath in processed_files or filepath.endswith(TEMP_SUFFIXES):
                 return
             
             print(f"[+] New File detected: {filepath}")
             processed_files.add(filepath)
+            self.track(filepath)
             try:
             # Wait for file to be fully written
                 for _ in range(5):  # Retry 5 times
@@ -118,50 +208,50 @@ class FileHandler(FileSystemEventHandler):
                 else:
                     print(f"[x] File inaccessible: {filepath}")
                     return
+                # Only a fully written file gets a size bucket
+                self.index_content(filepath)
 
                 # Get window context before moving file
                 window_info = get_active_window_info()
                 
-                # Add metadata to filename
-                new_path = self.add_metadata_to_filename(filepath, window_info)
-                
-                processed_files.add(new_path)
+                # Store source-app metadata beside the file (no rename needed)
+                get_metadata_index().record(
+                    filepath, window_info['process_name'], window_info['window_title']
+                )
+                if TAG_FILENAMES:
+                    new_path = self.add_metadata_to_filename(filepath, window_info)
+                    processed_files.add(new_path)
+                    self.untrack(filepath)
+                    self.track(new_path)
+                    self.index_content(new_path)
+                else:
+                    new_path = filepath
 
                 action = get_next_action(new_path,window_info)
 
                 final_path = new_path
 
                 if action['type'] == 'compress':
-                     self.record_compress_action(new_path)
+                     self.record_compress_action(new_path, action)
                 elif action['type'] == 'extract':
                     self.record_extract_action(new_path)
-                elif action['type'] in ['move', 'copy']:
+                elif action['type'] in ['move', 'copy', 'chain', 'dedupe', 'keep_best', 'transcode']:
                     self.record_pending_action(new_path, action)
                 elif action['type'] == 'encrypt':
                    self.record_encrypt_action(new_path)
                 elif action['type'] == 'decrypt':
                     self.record_decrypt_action(new_path)
                 elif action['type'] == 'delete' and action.get('time'):
-                    try:
-                        delta = parse_time_delta(action['time'])
-                        deletion_date = datetime.now() + delta
-                        
-                        # Update deletion schedule
-                        try:
-                            with open('files_to_be_deleted.txt', 'r') as f:
-                                scheduled = json.load(f)
-                        except (FileNotFoundError, json.JSONDecodeError):
-                            scheduled = {}
-                        
-                        scheduled[final_path] = deletion_date.isoformat()
-                        
-                        with open('files_to_be_deleted.txt', 'w') as f:
-                            json.dump(scheduled, f, indent=2)
-                        
-                        print(f"[✓] Scheduled deletion for {final_path} on {deletion_date}")
-                        
-                    except Exception as e:
-                        print(f"[x] Deletion scheduling failed: {str(e)}")
+                    # The retention sweeper deletes it once it is older than the
+                    # rule's age, so no per-file schedule entry is written; the
+                    # decision is recorded so the sweep never re-classifies it
+                    get_metadata_index().record_retention(
+                        final_path, action['rule'], parse_time_delta(action['time']).total_seconds(),
+                        action['disposable']
+                    )
+                    print(f"[✓] {final_path} falls under a {action['time']} retention policy")
+                    if evictor:
+                        evictor.mark_eligible(final_path, action['disposable'])
                 elif action['type'] == 'no_action':
                     print(f"[!] No matching rules for {new_path}")
                 else:
@@ -170,14 +260,57 @@ class FileHandler(FileSystemEventHandler):
                 print(f"[x] Critical error processing {filepath}: {str(e)}")
 
 
+    def on_deleted(self, event):
+        if not event.is_directory:
+            self.untrack(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.untrack(event.src_path)
+            self.track(event.dest_path)
+            self.index_content(event.dest_path)
+
+    def on_modified(self, event):
+        # A rewritten file moves to another size bucket
+        if not event.is_directory and find_inventory(event.src_path):
+            self.track(event.src_path)
+            get_dedup_index().refresh(event.src_path)
+
+    @staticmethod
+    def track(path):
+        """Keep the folder's mtime inventory current for retention sweeps"""
+        if path.endswith(TEMP_SUFFIXES):
+            return
+        inventory = find_inventory(path)
+        if inventory:
+            inventory.add(path)
+
+    @staticmethod
+    def index_content(path):
+        """Index a complete file for duplicate checks; images are hashed in the background"""
+        if find_inventory(path):
+            get_dedup_index().add(path)
+            if is_image(path):
+                content_indexer.submit(get_perceptual_index().ensure, path)
+
+    @staticmethod
+    def untrack(path):
+        inventory = find_inventory(path)
+        if inventory:
+            inventory.remove(path)
+            get_dedup_index().remove(path)
+            get_perceptual_index().remove(path)
+            if evictor:
+                evictor.forget(path)
+
     def record_encrypt_action(self, filepath):
         self._record_action('encrypt_actions.json', filepath)
 
     def record_decrypt_action(self, filepath):
         self._record_action('decrypt_actions.json', filepath)
 
-    def record_compress_action(self, filepath):
-        self._record_action('compress_actions.json', filepath)
+    def record_compress_action(self, filepath, action):
+        self._record_action('compress_actions.json', queue_entry(filepath, action))
 
     def record_extract_action(self, filepath):
         self._record_action('extract_actions.json', filepath)
@@ -207,12 +340,7 @@ class FileHandler(FileSystemEventHandler):
                 pending = []
                 
             # Add new action
-            pending.append({
-                "original_path": filepath,
-                "target_path": action.get('target'),
-                "type": action['type'],
-                "timestamp": datetime.now().isoformat()
-            })
+            pending.append(pending_record(filepath, action))
             
             # Save back to file
             with open('pending_actions.json', 'w') as f:
@@ -248,10 +376,14 @@ class FileHandler(FileSystemEventHandler):
 
 
 def start_monitoring(folders_to_watch):
+    global evictor
     observers = []                                                                          
 
     for folder in folders_to_watch:
         if os.path.exists(folder):
+            get_inventory(folder)
+            get_dedup_index().add_folder(folder)
+            get_perceptual_index().add_folder(folder)
             observer = Observer()
             observer.schedule(FileHandler(), path=folder, recursive=False)
             observer.start()
@@ -260,16 +392,34 @@ def start_monitoring(folders_to_watch):
         else:
             print(f"[x] Folder not found: {folder}", flush=True)
     
+    # Warm the models the current rules need so the first file isn't a cold start
+    models = get_model_manager()
+    sorter = FileSorter()
+    models.preload_async(required_models(sorter.rules, sorter.categories))
     scheduler = BackgroundScheduler()
+    # Carries on a key rotation cut short by a restart, then picks up files
+    # other processes sealed with the old key after it ran
+    scheduler.add_job(resume_reencryption, 'interval', minutes=5, max_instances=1, next_run_time=datetime.now())
     scheduler.add_job(check_scheduled_deletions, 'interval', seconds=30)
+    sweeper = RetentionSweeper([folder for folder in folders_to_watch if os.path.exists(folder)])
+    scheduler.add_job(sweeper.sweep, 'interval', seconds=30, max_instances=1)
+    evictor = SpacePressureEvictor([folder for folder in folders_to_watch if os.path.exists(folder)])
+    scheduler.add_job(evictor.check, 'interval', seconds=30, max_instances=1)
     scheduler.add_job(load_processed_files, 'interval', seconds=5)
+    scheduler.add_job(models.report, 'interval', minutes=10)
+    scheduler.add_job(get_metadata_index().prune, 'interval', hours=1)
+    scheduler.add_job(get_perceptual_index().save, 'interval', minutes=1)
 
     scheduler.start()
 
+    speculator = ForegroundSpeculator()
+    speculator.start()
+
     try:
         while True:
             time.sleep(1)
     except KeyboardInterrupt:
+        speculator.stop()
         for obs in observers:
             obs.stop()
         for obs in observers:
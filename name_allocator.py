@@ -0,0 +1,103 @@
+# name_allocator.py
+import os
+import re
+import threading
+from collections import OrderedDict
+
+MAX_TRACKED_NAMES = 1024
+# Collisions in a row before the directory is rescanned
+RESCAN_AFTER = 16
+
+
+class NameAllocator:
+    """Hands out collision-free destination names without probing base_1, base_2, ...
+
+    The highest suffix per (directory, base, ext) is learned from a single
+    scandir and then counted up in memory. Each name is claimed by creating
+    it exclusively, so two movers (or other processes writing the same
+    folder) can never be given the same path; a stale cache only costs a
+    retry.
+    """
+
+    def __init__(self, max_entries=MAX_TRACKED_NAMES):
+        self.max_entries = max_entries
+        self._next_suffix = OrderedDict()  # (dir, base, ext) -> next suffix to try
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _scan(dest_dir, base, ext):
+        """Return the first suffix above every existing base_N.ext (0 = base free)"""
+        pattern = re.compile(
+            re.escape(os.path.normcase(base)) + r"_(\d+)" + re.escape(os.path.normcase(ext)) + "$"
+        )
+        plain = os.path.normcase(base + ext)
+        highest, taken = 0, False
+        with os.scandir(dest_dir) as entries:
+            for entry in entries:
+                name = os.path.normcase(entry.name)
+                if name == plain:
+                    taken = True
+                    continue
+                match = pattern.match(name)
+                if match:
+                    highest = max(highest, int(match.group(1)))
+        if highest:
+            return highest + 1
+        return 1 if taken else 0
+
+    def _reserve(self, key, dest_dir, base, ext, rescan=False):
+        with self._lock:
+            if rescan or key not in self._next_suffix:
+                self._next_suffix[key] = self._scan(dest_dir, base, ext)
+            suffix = self._next_suffix[key]
+            self._next_suffix[key] = suffix + 1
+            self._next_suffix.move_to_end(key)
+            while len(self._next_suffix) > self.max_entries:
+                self._next_suffix.popitem(last=False)
+        return suffix
+
+    def claim(self, dest):
+        """Atomically create and return a free path for dest
+
+        The returned path exists as an empty placeholder that the caller
+        overwrites (or removes with release() if the operation fails).
+        """
+        dest_dir = os.path.dirname(dest) or '.'
+        base, ext = os.path.splitext(os.path.basename(dest))
+        key = (os.path.normcase(os.path.abspath(dest_dir)), os.path.normcase(base), os.path.normcase(ext))
+
+        collisions = 0
+        while True:
+            suffix = self._reserve(key, dest_dir, base, ext, rescan=collisions >= RESCAN_AFTER)
+            if collisions >= RESCAN_AFTER:
+                collisions = 0
+            name = f"{base}{ext}" if suffix == 0 else f"{base}_{suffix}{ext}"
+            candidate = os.path.join(dest_dir, name)
+            try:
+                fd = os.open(candidate, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                # Someone else wrote here since the scan; move past it
+                collisions += 1
+                continue
+            os.close(fd)
+            return candidate
+
+    @staticmethod
+    def release(path):
+        """Remove an unused placeholder created by claim()"""
+        try:
+            if os.path.exists(path) and os.path.getsize(path) == 0:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+_allocator = None
+
+
+def get_name_allocator():
+    """Process-wide allocator shared by every FileSorter"""
+    global _allocator
+    if _allocator is None:
+        _allocator = NameAllocator()
+    return _allocator
@@ -1,5 +1,118 @@
 # next_action.py
+import os
+import ast
+import json
+from datetime import datetime
 from file_sorter import FileSorter
+from file_deleter import schedule_deletions
+from metadata_index import get_metadata_index
+from retention import parse_time_delta
+from compress_extract import extract_file, list_members, member_path
+from image_similarity import NEAR_DUPLICATE_RADIUS
+from transcode import LOSSLESS_SOURCES
+
+# Actions the GUI lists per file; everything else waits in pending_actions.json
+QUEUE_FILES = {
+    'compress': 'compress_actions.json',
+    'extract': 'extract_actions.json',
+    'encrypt': 'encrypt_actions.json',
+    'decrypt': 'decrypt_actions.json',
+}
+PENDING_ACTIONS = ('move', 'copy', 'chain', 'dedupe', 'keep_best', 'transcode')
+
+
+def queue_entry(filepath, action):
+    """Queue file entry: the bare path, or {"path", "bundle"} for compress rules that bundle"""
+    if action['type'] == 'compress' and action.get('bundle'):
+        return {'path': filepath, 'bundle': True}
+    return filepath
+
+
+def entry_task(action_type, entry):
+    """Executor task for one queue file entry"""
+    if isinstance(entry, dict):
+        return {'type': action_type, 'src': entry['path'], 'bundle': entry.get('bundle', False)}
+    return {'type': action_type, 'src': entry}
+
+
+def entry_path(entry):
+    return entry['path'] if isinstance(entry, dict) else entry
+
+
+def pending_record(filepath, action):
+    """pending_actions.json entry awaiting the user's approval"""
+    return {
+        "original_path": filepath,
+        "target_path": action.get('target'),
+        "type": action['type'],
+        "variables": action.get('variables', {}),
+        "mode": action.get('mode', 'copy'),
+        "steps": action.get('steps', []),
+        "radius": action.get('radius'),
+        "format": action.get('format'),
+        "rule": action.get('rule'),
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+def queue_actions(decisions):
+    """Queue (filepath, action) decisions with one read and write per queue file"""
+    batches = {}
+    for filepath, action in decisions:
+        if action['type'] in QUEUE_FILES:
+            batches.setdefault(QUEUE_FILES[action['type']], []).append(queue_entry(filepath, action))
+        elif action['type'] in PENDING_ACTIONS:
+            batches.setdefault('pending_actions.json', []).append(pending_record(filepath, action))
+
+    for queue, records in batches.items():
+        try:
+            with open(queue, 'r') as f:
+                actions = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            actions = []
+        actions.extend(records)
+        with open(queue, 'w') as f:
+            json.dump(actions, f, indent=2)
+        print(f"[✓] Queued {len(records)} actions in {queue}")
+
+
+def extract_members(archive_path, output_dir, decisions):
+    """Extract the members whose decided actions need them on disk, then queue those actions
+
+    Only members an untimed delete rule matches stay inside the archive.
+    Members under a timed delete rule are extracted and given to retention
+    like any new file: the rule is recorded for the sweeper and the
+    deletion is scheduled. Returns the extracted paths.
+    """
+    def stays_packed(action):
+        return action['type'] == 'delete' and not action.get('time')
+
+    needed = {name for name, action in decisions.items() if not stays_packed(action)}
+    skipped = len(decisions) - len(needed)
+    if skipped:
+        print(f"[✓] Left {skipped} unwanted members inside {archive_path}")
+    if not needed:
+        return []
+
+    produced = extract_file(archive_path, output_dir, members=needed)
+    if produced is None:
+        return None
+    queue_actions([
+        (member_path(output_dir, name), action)
+        for name, action in decisions.items()
+        if name in needed and action['type'] != 'no_action'
+    ])
+
+    timed, now = [], datetime.now()
+    for name, action in decisions.items():
+        if name in needed and action['type'] == 'delete':
+            path = member_path(output_dir, name)
+            max_age = parse_time_delta(action['time'])
+            get_metadata_index().record_retention(path, action['rule'], max_age.total_seconds(),
+                                                  action['disposable'])
+            timed.append((path, now + max_age, action['disposable']))
+    schedule_deletions(timed)
+    return produced
  
 class ActionDecider(FileSorter):
     def __init__(self):
@@ -9,25 +122,137 @@ class ActionDecider(FileSorter):
     def decide_action(self, filepath, window_info):
         variables = self.extract_variables(filepath, window_info)
         variables['category'] = self.determine_category(filepath, variables)
+        return self.action_for(variables)
+
+    def action_for(self, variables, rules=None):
+        """Action of the first rule (of rules, default all) matching variables, with its target resolved"""
+        rule = self.first_matching_rule(variables, rules)
+        if rule:
+            action = {
+                'type': rule['action']['type'],
+                'time': rule['action'].get('time')
+            }
+
+            if action['type'] == 'copy':
+                action['mode'] = rule['action'].get('mode', 'copy')
+            elif action['type'] == 'compress':
+                # Small files join a rolling bundle only when the rule asks for it
+                action['bundle'] = bool(rule['action'].get('bundle'))
+            elif action['type'] == 'delete':
+                action['disposable'] = bool(rule['action'].get('disposable'))
+                # Retention sweeps match files to their rule by its condition
+                action['rule'] = rule['condition']
+            elif action['type'] == 'dedupe':
+                if 'is_duplicate' not in variables or not variables['is_duplicate']:
+                    return {'type': 'no_action'}
+                action['target'] = variables['duplicate_of']
+                action['mode'] = rule['action'].get('mode', 'delete')
+            elif action['type'] == 'keep_best':
+                if 'near_duplicate_count' not in variables or not variables['near_duplicate_count']:
+                    return {'type': 'no_action'}
+                action['radius'] = rule['action'].get('radius', NEAR_DUPLICATE_RADIUS)
+            elif action['type'] == 'transcode':
+                if variables.get('filetype') not in LOSSLESS_SOURCES:
+                    return {'type': 'no_action'}
+                action['format'] = rule['action'].get('format', 'png')
+                # Savings are reported per rule, named by its condition
+                action['rule'] = rule['condition']
 
-        for rule in sorted(self.rules, key=lambda x: x.get('priority', 1), reverse=True):
-            if self.evaluate_rule(rule['condition'], variables):
-                action = {
-                    'type': rule['action']['type'],
-                    'time': rule['action'].get('time')
+            # Add compress/extract to valid action types for target_path resolution
+            if action['type'] in ['move', 'copy', 'compress', 'extract'] and 'target_path' in rule['action']:
+                template = rule['action']['target_path']
+                action['target'] = self.resolve_template(template, variables)
+                # Hand the resolved values on so execution skips AI generation
+                action['variables'] = {
+                    var: str(variables[var])
+                    for var in self.variable_pattern.findall(template)
                 }
 
-                # Add compress/extract to valid action types for target_path resolution
-                if action['type'] in ['move', 'copy', 'compress', 'extract'] and 'target_path' in rule['action']:
-                    action['target'] = self.resolve_template(
-                        rule['action']['target_path'],
-                        variables
-                    )
+            # Follow-up steps ("then") are run as one fused plan
+            if rule['action'].get('then'):
+                action['steps'] = [
+                    self.resolve_step(step, variables)
+                    for step in [rule['action'], *rule['action']['then']]
+                ]
+                action['type'] = 'chain'
+                placements = [step['target'] for step in action['steps'] if step.get('target')]
+                action['target'] = placements[-1] if placements else None
 
-                return action
+            return action
 
         return {'type': 'no_action'}
 
+    def decide_archive(self, archive_path, window_info=None):
+        """Decide an action for every archive member from its listing alone
+
+        Members get filename, filetype, size, magic (type sniffed from the
+        first bytes), archive_name and the archive's source-app variables;
+        nothing is written to disk. Only rules whose every variable is among
+        those are tried, so no rule fires on evidence that was never
+        gathered. Members that cannot be read or decided are handled on
+        their own: unreadable ones stay packed, undecided ones get no action.
+        """
+        window_info = {**self.metadata_index.lookup(archive_path), **(window_info or {})}
+        source = {
+            'source_app': window_info.get('process_name', 'unknown'),
+            'window_title': window_info.get('window_title', ''),
+            'source_category': self.classify_application(
+                window_info.get('process_name', 'unknown'),
+                window_info.get('window_title', '')
+            ),
+            'archive_name': os.path.basename(archive_path),
+        }
+        source['category'] = source['source_category']
+
+        decisions = {}
+        for member in list_members(archive_path):
+            if member['magic'] is None:
+                print(f"[!] Leaving unreadable member {member['name']} inside {archive_path}")
+                continue
+            variables = {
+                **source,
+                'filename': os.path.basename(member['name']),
+                'filetype': os.path.splitext(member['name'])[1][1:].lower(),
+                'size': member['size'],
+                'magic': member['magic'],
+            }
+            # Members have no file on disk for lazy or AI variables to read
+            rules = [rule for rule in self.rules if self.condition_names(rule) <= variables.keys()]
+            try:
+                decisions[member['name']] = self.action_for(variables, rules)
+            except Exception as e:
+                print(f"[x] Failed to decide {member['name']} in {archive_path}: {str(e)}")
+                decisions[member['name']] = {'type': 'no_action'}
+        return decisions
+
+    @staticmethod
+    def condition_names(rule):
+        """Variable names a rule's condition reads (names it binds itself excluded)"""
+        try:
+            tree = ast.parse(rule['condition'], mode='eval')
+        except (SyntaxError, KeyError, TypeError):
+            return set()
+        loads, bound = set(), {'True', 'False', 'None'}
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Name):
+                (loads if isinstance(node.ctx, ast.Load) else bound).add(node.id)
+            elif isinstance(node, ast.arg):
+                bound.add(node.arg)
+        return loads - bound
+
+    def extract_archive(self, archive_path, output_dir):
+        """Decide every member from the listing, then extract what those actions need"""
+        return extract_members(archive_path, output_dir, self.decide_archive(archive_path))
+
+    def resolve_step(self, step, variables):
+        """Reduce one action step to its type, resolved target and copy mode"""
+        resolved = {'type': step['type']}
+        if 'target_path' in step:
+            resolved['target'] = self.resolve_template(step['target_path'], variables)
+        if step.get('mode'):
+            resolved['mode'] = step['mode']
+        return resolved
+
 
 
 def get_next_action(filepath, window_info):
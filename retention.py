@@ -0,0 +1,260 @@
+# retention.py
+import os
+import json
+import time
+import bisect
+import threading
+from datetime import timedelta
+from file_deleter import delete_files
+from metadata_index import get_metadata_index
+from file_metadata import LazyVariables
+
+RETENTION_POLICIES_FILE = 'retention_policies.json'
+# A file arriving with an mtime this far in the past (copies, extractions)
+# lands behind the sweep cursors, which are rewound to pick it up
+LATE_ARRIVAL_SLACK = 60
+
+
+def parse_time_delta(time_str):
+    value, unit = time_str.split()
+    value = int(value)
+
+    # Normalize unit by stripping trailing 's' if it's plural
+    unit = unit.lower().rstrip('s')
+
+    # Map normalized unit to timedelta argument
+    unit_map = {
+        'day': 'days',
+        'hour': 'hours',
+        'minute': 'minutes',
+        'second': 'seconds'
+    }
+
+    if unit not in unit_map:
+        raise ValueError(f"Unsupported time unit: {unit}")
+
+    return timedelta(**{unit_map[unit]: value})
+
+
+def _folder_key(folder):
+    return os.path.normcase(os.path.abspath(folder))
+
+
+class DirectoryInventory:
+    """Files of one watched folder kept sorted by mtime, updated from watcher events"""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self._entries = []   # sorted (mtime, path)
+        self._mtimes = {}    # path -> mtime
+        self._lock = threading.Lock()
+        self.rewind_to = None
+        self.scan()
+
+    def scan(self):
+        entries = []
+        try:
+            with os.scandir(self.folder) as it:
+                for entry in it:
+                    if entry.is_file(follow_symlinks=False):
+                        entries.append((entry.stat().st_mtime, entry.path))
+        except OSError as e:
+            print(f"[x] Inventory scan failed for {self.folder}: {str(e)}")
+        entries.sort()
+        with self._lock:
+            self._entries = entries
+            self._mtimes = {path: mtime for mtime, path in entries}
+
+    def _remove_locked(self, path):
+        mtime = self._mtimes.pop(path, None)
+        if mtime is not None:
+            index = bisect.bisect_left(self._entries, (mtime, path))
+            if index < len(self._entries) and self._entries[index] == (mtime, path):
+                del self._entries[index]
+
+    def add(self, path):
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return
+        with self._lock:
+            self._remove_locked(path)
+            bisect.insort(self._entries, (mtime, path))
+            self._mtimes[path] = mtime
+            if mtime < time.time() - LATE_ARRIVAL_SLACK:
+                self.rewind_to = mtime if self.rewind_to is None else min(self.rewind_to, mtime)
+
+    def remove(self, path):
+        with self._lock:
+            self._remove_locked(path)
+
+    def take_rewind(self):
+        with self._lock:
+            rewind, self.rewind_to = self.rewind_to, None
+            return rewind
+
+    def older_than(self, cutoff, after=None):
+        """Entries with mtime <= cutoff, oldest first, strictly after the cursor
+
+        Only the expiring slice is copied, so the cost follows what expires
+        rather than the folder size.
+        """
+        with self._lock:
+            lo = bisect.bisect_right(self._entries, after) if after else 0
+            hi = bisect.bisect_right(self._entries, (cutoff, '\U0010ffff'))
+            return self._entries[lo:hi] if hi > lo else []
+
+    def oldest(self):
+        """Iterate entries oldest first without copying the inventory
+
+        Each step finds the entry after the previous one by bisection, so
+        entries added or removed meanwhile are seen or skipped correctly.
+        """
+        previous = None
+        while True:
+            with self._lock:
+                index = bisect.bisect_right(self._entries, previous) if previous else 0
+                if index >= len(self._entries):
+                    return
+                previous = self._entries[index]
+            yield previous
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_inventories = {}
+
+
+def get_inventory(folder):
+    """Inventory for a watched folder, scanned once on first use"""
+    key = _folder_key(folder)
+    if key not in _inventories:
+        _inventories[key] = DirectoryInventory(folder)
+    return _inventories[key]
+
+
+def find_inventory(path):
+    """Inventory tracking the folder that contains path, if it is watched"""
+    return _inventories.get(_folder_key(os.path.dirname(path)))
+
+
+def load_policies(folders, rules):
+    """Explicit policies from retention_policies.json plus one per delete rule and folder
+
+    Explicit policies look like:
+        {"folder": "...", "condition": "filetype == 'tmp'", "max_age": "7 days",
+         "disposable": false, "only_tracked": false}
+    """
+    try:
+        with open(RETENTION_POLICIES_FILE, 'r') as f:
+            explicit = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        explicit = []
+
+    policies = []
+    for policy in explicit:
+        policies.append({
+            'folder': policy['folder'],
+            'condition': policy.get('condition', 'True'),
+            'max_age': parse_time_delta(policy['max_age']),
+            'disposable': bool(policy.get('disposable')),
+            'only_tracked': policy.get('only_tracked', False),
+            'rule': None,
+        })
+
+    for rule in rules:
+        action = rule.get('action', {})
+        if action.get('type') != 'delete' or not action.get('time'):
+            continue
+        for folder in folders:
+            policies.append({
+                'folder': folder,
+                'condition': rule['condition'],
+                'max_age': parse_time_delta(action['time']),
+                'disposable': bool(action.get('disposable')),
+                # Only files the monitor saw arrive have the context the rule needs
+                'only_tracked': True,
+                'rule': rule,
+            })
+    return policies
+
+
+class RetentionSweeper:
+    """Deletes files past their policy's maximum age, walking the mtime index"""
+
+    def __init__(self, folders):
+        self.folders = folders
+        self.cursors = {}  # policy key -> last (mtime, path) evaluated
+
+    @staticmethod
+    def _policy_key(policy):
+        return (_folder_key(policy['folder']), policy['condition'], policy['max_age'].total_seconds())
+
+    @staticmethod
+    def _matches(sorter, policy, path):
+        """Whether policy applies to path, without asking any model
+
+        Rule policies trust the decision recorded when the file arrived.
+        Explicit policies see the file's own variables: name, type, the
+        recorded source app and lazily read document metadata.
+        """
+        index = get_metadata_index()
+        if policy['rule'] is not None:
+            recorded = index.retention(path)
+            return bool(recorded) and recorded['condition'] == policy['condition'] \
+                and recorded['max_age'] == policy['max_age'].total_seconds()
+        metadata = index.lookup(path)
+        if policy['only_tracked'] and not metadata:
+            return False
+        variables = LazyVariables(path, {
+            'filename': os.path.basename(path),
+            'filetype': os.path.splitext(path)[1][1:].lower(),
+            'source_app': metadata.get('process_name', 'unknown'),
+            'window_title': metadata.get('window_title', ''),
+        })
+        return bool(sorter.evaluate_rule(policy['condition'], variables))
+
+    def sweep(self):
+        from file_sorter import FileSorter
+        sorter = FileSorter()
+        policies = load_policies(self.folders, sorter.rules)
+        now = time.time()
+
+        rewinds = {}
+        for folder in self.folders:
+            rewinds[_folder_key(folder)] = get_inventory(folder).take_rewind()
+
+        due = {False: {}, True: {}}   # disposable -> {path: (policy key, mtime)}
+        for policy in policies:
+            inventory = get_inventory(policy['folder'])
+            key = self._policy_key(policy)
+            cursor = self.cursors.get(key)
+            rewind = rewinds.get(_folder_key(policy['folder']))
+            if cursor and rewind is not None and rewind <= cursor[0]:
+                cursor = (rewind, '')
+
+            cutoff = now - policy['max_age'].total_seconds()
+            for mtime, path in inventory.older_than(cutoff, after=cursor):
+                cursor = (mtime, path)
+                if path in due[False] or path in due[True] or not os.path.exists(path):
+                    continue
+                try:
+                    if self._matches(sorter, policy, path):
+                        due[policy['disposable']][path] = (key, mtime)
+                except Exception as e:
+                    print(f"[x] Retention check failed for {path}: {str(e)}")
+            self.cursors[key] = cursor
+
+        for disposable, candidates in due.items():
+            if not candidates:
+                continue
+            deleted = set(delete_files(list(candidates), disposable=disposable)['deleted'])
+            for path, (key, mtime) in candidates.items():
+                inventory = find_inventory(path)
+                if path in deleted:
+                    if inventory:
+                        inventory.remove(path)
+                elif os.path.exists(path) and self.cursors.get(key) and mtime <= self.cursors[key][0]:
+                    # Retry files that failed to delete on the next sweep
+                    self.cursors[key] = (mtime, '')
@@ -27,10 +27,20 @@ def create_rule_from_natural_language(user_input):
     OUTPUT FORMAT, ENSURE PROPER JSON FORMATTING (ONLY ONE RULE):
     {{
         "condition": "source_category == '...'" or "source_category != '...'" or "filetype == '...'",
+        // documents may also use pdf_pages, pdf_title, pdf_author, doc_title, doc_author,
+        // doc_subject, doc_keywords, doc_pages, zip_members, zip_uncompressed_size, zip_dominant_ext,
+        // is_duplicate, duplicate_of (use action type "dedupe" to remove byte-identical copies)
+        // archive members (rules run on them before extraction) have size, magic, archive_name
+        // images also have near_duplicate_count (action type "keep_best" keeps the sharpest of a burst)
+        // action type "transcode" re-encodes png/bmp/tiff losslessly, with "format": "png/webp"
         "action": {{
             "type": "move/delete/copy",
             "target_path": "absolute path from C:/Users/g6msd/OneDrive/Pictures/Screenshots", // if move/copy
-            "time": "X days/hours"        // if delete
+            "time": "X days/hours",       // if delete
+            "disposable": true,           // optional, delete without the recycle bin
+            "bundle": true,               // optional, compress only: small files join a daily bundle zip
+            "mode": "copy/reflink/hardlink/auto", // optional, copy only
+            "then": [{{"type": "encrypt/move/...", ...}}] // optional follow-up steps
         }},
         "priority": <one source_category condition is 1 point, a filetype condition is 2 points>
     }}
@@ -0,0 +1,163 @@
+# space_pressure.py
+import os
+import json
+import heapq
+import shutil
+import threading
+from file_deleter import delete_files, parse_schedule_entry
+from file_transfer import device_of
+from metadata_index import get_metadata_index
+from retention import get_inventory
+
+SPACE_PRESSURE_FILE = 'space_pressure.json'
+# Start evicting below LOW_WATER free, stop once HIGH_WATER is free again
+LOW_WATER_PERCENT = 5
+HIGH_WATER_PERCENT = 10
+
+
+def load_watermarks():
+    """Low/high water marks, overridable in space_pressure.json"""
+    try:
+        with open(SPACE_PRESSURE_FILE, 'r') as f:
+            config = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        config = {}
+    low = config.get('low_water_percent', LOW_WATER_PERCENT)
+    high = max(low, config.get('high_water_percent', HIGH_WATER_PERCENT))
+    return low, high
+
+
+class SpacePressureEvictor:
+    """Frees space on watched volumes by deleting delete-rule files, oldest first
+
+    Only files already known to fall under a delete rule are kept, in one
+    mtime heap per volume. The heaps grow as the monitor marks arrivals
+    and as other processes record retention, and shrink as files are
+    deleted, so an eviction pops victims without rescanning any folder.
+    """
+
+    def __init__(self, folders):
+        self.volumes = {}
+        self.watched = {}  # normalized folder -> its volume
+        for folder in folders:
+            device = device_of(folder)
+            self.volumes.setdefault(device, []).append(folder)
+            self.watched[os.path.normcase(os.path.abspath(folder))] = device
+        self.heaps = {device: [] for device in self.volumes}  # device -> heap of (mtime, path)
+        self.eligible = {}  # path -> (mtime in its heap, disposable)
+        self._synced = ''  # retention recorded up to this time is already in the heaps
+        self._lock = threading.Lock()
+
+    def mark_eligible(self, path, disposable=False):
+        """Record the monitor's decision that path falls under a delete rule"""
+        with self._lock:
+            self._push(path, disposable)
+
+    def forget(self, path):
+        """Drop a deleted or moved file; its heap entry is skipped when reached"""
+        with self._lock:
+            self.eligible.pop(os.path.abspath(path), None)
+
+    def _push(self, path, disposable):
+        path = os.path.abspath(path)
+        device = self.watched.get(os.path.normcase(os.path.abspath(os.path.dirname(path))))
+        if device is None:
+            return
+        if path in self.eligible:
+            self.eligible[path] = (self.eligible[path][0], disposable)
+            return
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return
+        self.eligible[path] = (mtime, disposable)
+        heapq.heappush(self.heaps[device], (mtime, path))
+
+    @staticmethod
+    def _scheduled_paths():
+        """{path: disposable} from files_to_be_deleted.txt"""
+        try:
+            with open('files_to_be_deleted.txt', 'r') as f:
+                return {path: parse_schedule_entry(value)[1] for path, value in json.load(f).items()}
+        except (FileNotFoundError, json.JSONDecodeError, AttributeError, ValueError):
+            return {}
+
+    def _sync(self):
+        """Pick up delete decisions made elsewhere: scheduled files and newly recorded retention"""
+        for path, disposable in self._scheduled_paths().items():
+            self._push(path, disposable)
+        for path, disposable, recorded in get_metadata_index().retention_since(self._synced):
+            self._push(path, disposable)
+            self._synced = max(self._synced, recorded)
+
+    def check(self):
+        """Evict on every watched volume that is below its low-water mark"""
+        low, high = load_watermarks()
+        for device, folders in self.volumes.items():
+            try:
+                usage = shutil.disk_usage(folders[0])
+            except OSError as e:
+                print(f"[x] Free space check failed for {folders[0]}: {str(e)}")
+                continue
+            if usage.free * 100 >= usage.total * low:
+                continue
+
+            target_free = usage.total * high // 100
+            needed = target_free - usage.free
+            print(f"[!] {folders[0]} volume has {usage.free / 1e9:.1f} GB free, "
+                  f"evicting {needed / 1e6:.1f} MB")
+            self.evict(device, needed)
+
+    def _pop_victims(self, device, needed):
+        """Oldest eligible files on the volume until `needed` bytes are planned"""
+        heap = self.heaps[device]
+        victims, planned = {False: [], True: []}, 0
+        while heap and planned < needed:
+            mtime, path = heapq.heappop(heap)
+            if self.eligible.get(path, (None,))[0] != mtime:
+                continue  # Forgotten, or superseded by a newer entry
+            disposable = self.eligible[path][1]
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self.eligible[path]
+                continue
+            if stat.st_mtime != mtime:
+                # Rewritten since it was marked; it now sorts by its new age
+                self.eligible[path] = (stat.st_mtime, disposable)
+                heapq.heappush(heap, (stat.st_mtime, path))
+                continue
+            planned += stat.st_size
+            victims[disposable].append(path)
+        return victims
+
+    def evict(self, device, needed):
+        """Delete eligible files in age order until `needed` bytes are freed
+
+        Victims go through delete_files like any other deletion: to the
+        recycle bin unless their rule marks them disposable.
+        """
+        with self._lock:
+            self._sync()
+            victims = self._pop_victims(device, needed)
+
+        if not victims[False] and not victims[True]:
+            print("[!] No files eligible for eviction")
+            return 0
+
+        freed = 0
+        for disposable, paths in victims.items():
+            if not paths:
+                continue
+            result = delete_files(paths, disposable=disposable)
+            deleted = set(result['deleted'])
+            with self._lock:
+                for path in paths:
+                    if path in deleted:
+                        self.eligible.pop(path, None)
+                        get_inventory(os.path.dirname(path)).remove(path)
+                    elif path in self.eligible:
+                        # Could not be deleted this time; stays in line
+                        heapq.heappush(self.heaps[device], (self.eligible[path][0], path))
+            freed += result['freed_bytes']
+        return freed
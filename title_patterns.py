@@ -0,0 +1,140 @@
+# title_patterns.py
+import os
+import re
+import json
+import threading
+
+TITLE_PATTERNS_FILE = 'title_patterns.json'
+MAX_TEMPLATES_PER_PROCESS = 8
+MAX_KNOWN_TITLES = 500
+# Distinct titles a process must map to the same name before it is pinned
+PIN_AFTER = 2
+# Sorters in one process (the monitor and the foreground speculator) share the file
+_learn_lock = threading.Lock()
+BARE_TEMPLATE = "^(?P<game>.+?)$"
+
+# Noise that launchers and engines append to game window titles
+_TITLE_NOISE = [
+    re.compile(r"\s*[-–|:]\s*(steam|epic games( launcher)?|gog galaxy|origin|ea app|ubisoft connect)\s*$", re.I),
+    re.compile(r"\s*[\(\[]?\b(v|ver\.?|version|build)\s*\d+(\.\d+)*[a-z]?\b[\)\]]?", re.I),
+    re.compile(r"\s+\d+\.\d+(\.\d+)+\b"),
+    re.compile(r"\s*[\(\[](64|32)[- ]?bit[\)\]]", re.I),
+    re.compile(r"\s*[\(\[]?\b(dx\s?(9|10|11|12)|directx\s?\d+|vulkan|opengl)\b[\)\]]?", re.I),
+    re.compile(r"\s*[-–|:]\s*$"),
+]
+
+
+def normalize_title(title):
+    """Strip launcher suffixes, version numbers and renderer tags from a window title"""
+    cleaned = (title or '').strip()
+    for pattern in _TITLE_NOISE:
+        cleaned = pattern.sub('', cleaned)
+    return re.sub(r"\s+", ' ', cleaned).strip().lower()
+
+
+def process_stem(process_name):
+    """helltaker.exe -> helltaker"""
+    return os.path.splitext((process_name or '').lower())[0]
+
+
+def _squash(text):
+    return re.sub(r"[^a-z0-9]", '', text.lower())
+
+
+def _template_for(title, answer):
+    """Turn (normalized title, answer) into a regex with the answer as a capture group"""
+    start = title.find(answer)
+    # An answer spanning the whole title would match every title as itself
+    if start < 0 or answer == title:
+        return None
+    prefix, suffix = title[:start], title[start + len(answer):]
+    literal = lambda text: re.sub(r"\d+", r"\\d+", re.escape(text))
+    return f"^{literal(prefix)}(?P<game>.+?){literal(suffix)}$"
+
+
+class TitlePatternStore:
+    """Per-process table of title templates learned from past model answers"""
+
+    def __init__(self, path=TITLE_PATTERNS_FILE):
+        self.path = path
+        self.processes = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                self.processes = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.processes = {}
+
+    def save(self):
+        try:
+            with open(self.path, 'w') as f:
+                json.dump(self.processes, f, indent=2)
+        except Exception as e:
+            print(f"[x] Failed to save title patterns: {str(e)}")
+
+    def _entry(self, process_name):
+        return self.processes.setdefault(process_stem(process_name), {
+            'game_name': None,
+            'templates': [],
+            'titles': {},
+        })
+
+    def lookup(self, process_name, window_title):
+        """Return the game name if it can be answered locally, otherwise None"""
+        entry = self.processes.get(process_stem(process_name))
+        title = normalize_title(window_title)
+
+        if entry:
+            if entry.get('game_name'):
+                return entry['game_name']
+            if title in entry.get('titles', {}):
+                return entry['titles'][title]
+            for template in entry.get('templates', []):
+                if template == BARE_TEMPLATE:
+                    continue  # Learned before whole-title answers were refused
+                match = re.match(template, title)
+                if match and match.group('game').strip():
+                    return match.group('game').strip()
+
+        # A process named after its own window title needs no model at all
+        stem = process_stem(process_name)
+        if stem and title and _squash(stem) == _squash(title):
+            return title
+        return None
+
+    def learn(self, process_name, window_title, game_name):
+        """Record a model answer and derive reusable patterns from it"""
+        game_name = (game_name or '').strip().lower()
+        if not game_name or not process_stem(process_name):
+            return
+        title = normalize_title(window_title)
+        with _learn_lock:
+            self._learn(process_name, title, game_name)
+
+    def _learn(self, process_name, title, game_name):
+        # Long-lived sorters must not overwrite patterns learned by others
+        self.load()
+        entry = self._entry(process_name)
+
+        entry['titles'][title] = game_name
+        if len(entry['titles']) > MAX_KNOWN_TITLES:
+            entry['titles'].pop(next(iter(entry['titles'])))
+
+        # helltaker.exe -> "helltaker" is pinned straight away
+        if _squash(process_stem(process_name)) == _squash(game_name):
+            entry['game_name'] = game_name
+        elif sum(1 for name in entry['titles'].values() if name == game_name) >= PIN_AFTER \
+                and set(entry['titles'].values()) == {game_name}:
+            entry['game_name'] = game_name
+        elif entry.get('game_name') and entry['game_name'] != game_name:
+            # The process hosts more than one game (launchers, emulators)
+            entry['game_name'] = None
+
+        template = _template_for(title, game_name)
+        if template and template not in entry['templates']:
+            entry['templates'].insert(0, template)
+            del entry['templates'][MAX_TEMPLATES_PER_PROCESS:]
+
+        self.save()
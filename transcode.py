@@ -0,0 +1,155 @@
+# transcode.py
+import os
+import json
+import shutil
+from datetime import datetime
+from PIL import Image, PngImagePlugin
+from name_allocator import get_name_allocator
+from metadata_index import get_metadata_index
+
+TRANSCODE_STATS_FILE = 'transcode_stats.jsonl'
+# Sources worth re-encoding losslessly; JPEGs would only grow
+LOSSLESS_SOURCES = ('png', 'bmp', 'tif', 'tiff', 'webp')
+TARGET_FORMATS = ('png', 'webp')
+# Lossless WebP is 8 bits per channel; deeper images stay PNG
+WEBP_MODES = ('1', 'L', 'LA', 'P', 'PA', 'RGB', 'RGBA')
+
+
+def _save_options(img, target):
+    options = {key: img.info[key] for key in ('icc_profile', 'exif', 'dpi') if img.info.get(key)}
+    if target == 'webp':
+        options.pop('dpi', None)
+        # exact keeps the colour under fully transparent pixels
+        return {**options, 'format': 'WEBP', 'lossless': True, 'quality': 100, 'method': 6, 'exact': True}
+    text = PngImagePlugin.PngInfo()
+    for key, value in getattr(img, 'text', {}).items():
+        text.add_text(key, value)
+    return {**options, 'format': 'PNG', 'optimize': True, 'pnginfo': text}
+
+
+def same_pixels(original, candidate):
+    """True if both images decode to the same size and colour of every pixel"""
+    if original.size != candidate.size:
+        return False
+    if original.mode == candidate.mode and original.mode not in ('P', 'PA'):
+        return original.tobytes() == candidate.tobytes()
+    # Palettes may be reordered; compare resolved colours
+    return original.convert('RGBA').tobytes() == candidate.convert('RGBA').tobytes()
+
+
+def record_transcode(file_path, rule, target, original_size, new_size):
+    """Append one line per file so savings can be totalled per rule"""
+    try:
+        with open(TRANSCODE_STATS_FILE, 'a') as f:
+            f.write(json.dumps({
+                't': datetime.now().isoformat(timespec='seconds'),
+                'file': file_path,
+                'rule': rule or '',
+                'format': target,
+                'in': original_size,
+                'out': new_size,
+            }, separators=(',', ':')) + '\n')
+    except Exception as e:
+        print(f"[x] Failed to record transcode stats: {str(e)}")
+
+
+def savings_by_rule(stats_path=TRANSCODE_STATS_FILE):
+    """{rule: {'files', 'in', 'out', 'saved'}} from the transcode log"""
+    totals = {}
+    try:
+        with open(stats_path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                rule = totals.setdefault(entry['rule'], {'files': 0, 'in': 0, 'out': 0, 'saved': 0})
+                rule['files'] += 1
+                rule['in'] += entry['in']
+                rule['out'] += entry['out']
+                rule['saved'] += entry['in'] - entry['out']
+    except FileNotFoundError:
+        pass
+    return totals
+
+
+def report_savings():
+    """Print bytes reclaimed by each transcode rule"""
+    for rule, totals in sorted(savings_by_rule().items(), key=lambda item: -item[1]['saved']):
+        print(f"[✓] {rule or 'unnamed rule'}: {totals['saved'] / 1e6:.1f} MB saved "
+              f"over {totals['files']} files ({totals['out'] / totals['in'] if totals['in'] else 1:.0%} of original)")
+
+
+def _keep_original(file_path, rule, target, original_size, reason):
+    """Record a transcode that left the file alone so the action is not retried"""
+    record_transcode(file_path, rule, target, original_size, original_size)
+    print(f"[!] Kept {file_path} as is: {reason}")
+    return file_path
+
+
+def transcode_image(file_path, target='png', rule=None):
+    """Re-encode an image losslessly; returns its path afterwards
+
+    The new encoding is written beside the original, decoded again and
+    compared pixel for pixel; the original is only replaced if they match
+    and the new file is smaller. WebP output gets a .webp name. Images
+    that cannot be re-encoded without loss (several frames, or a mode the
+    target cannot store) are kept unchanged and returned as they are.
+    """
+    if target not in TARGET_FORMATS:
+        raise ValueError(f"Unsupported transcode format: {target}")
+    original_size = os.path.getsize(file_path)
+    with Image.open(file_path) as img:
+        if getattr(img, 'n_frames', 1) > 1:
+            return _keep_original(file_path, rule, target, original_size, "it has several frames")
+        img.load()
+        if target == 'webp' and img.mode not in WEBP_MODES:
+            target = 'png'
+        # .part is skipped by the folder monitor
+        temp = f"{file_path}.part"
+        try:
+            img.save(temp, **_save_options(img, target))
+            with Image.open(temp) as candidate:
+                candidate.load()
+                if not same_pixels(img, candidate):
+                    os.remove(temp)
+                    return _keep_original(file_path, rule, target, original_size,
+                                          f"{target} output differs from the original pixels")
+            new_size = os.path.getsize(temp)
+            if new_size >= original_size:
+                os.remove(temp)
+                return _keep_original(file_path, rule, target, original_size,
+                                      f"already as small as lossless {target} gets")
+        except (OSError, ValueError, KeyError) as e:
+            # Pillow cannot write every mode to every format (e.g. CMYK to PNG)
+            if os.path.exists(temp):
+                os.remove(temp)
+            return _keep_original(file_path, rule, target, original_size, f"{target} save failed: {str(e)}")
+        except BaseException:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+
+    metadata = get_metadata_index().lookup(file_path)
+    shutil.copystat(file_path, temp)
+    stem, ext = os.path.splitext(file_path)
+    if ext.lower() == f".{target}":
+        output = file_path
+    else:
+        output = get_name_allocator().claim(f"{stem}.{target}")
+    try:
+        os.replace(temp, output)
+    except Exception:
+        if output != file_path:
+            get_name_allocator().release(output)
+        os.remove(temp)
+        raise
+    if output != file_path:
+        os.remove(file_path)
+    if metadata:
+        get_metadata_index().record(output, metadata['process_name'], metadata['window_title'])
+
+    record_transcode(output, rule, target, original_size, new_size)
+    print(f"[✓] Transcoded {file_path} -> {output} "
+          f"({(original_size - new_size) / 1e3:.0f} KB saved, {new_size / original_size:.0%} of original)")
+    return output
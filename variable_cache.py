@@ -0,0 +1,68 @@
+# variable_cache.py
+import json
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from title_patterns import normalize_title
+
+VARIABLE_CACHE_FILE = 'variable_cache.json'
+MAX_CACHED_VARIABLES = 1000
+CACHE_TTL = timedelta(days=30)
+
+
+def depends_on_filename(var_name):
+    """Variables like file_name are generated from the file itself, not just its window"""
+    return 'file' in var_name.lower()
+
+
+class VariableCache:
+    """Persistent LRU memo of AI-generated template variables"""
+
+    def __init__(self, path=VARIABLE_CACHE_FILE, max_entries=MAX_CACHED_VARIABLES, ttl=CACHE_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.load()
+
+    @staticmethod
+    def make_key(var_name, source_app, window_title, filename=None):
+        key = f"{var_name}|{(source_app or '').lower()}|{normalize_title(window_title)}"
+        if depends_on_filename(var_name):
+            key = f"{key}|{filename or ''}"
+        return key
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                self.entries = OrderedDict(json.load(f))
+        except (FileNotFoundError, json.JSONDecodeError, TypeError, ValueError):
+            self.entries = OrderedDict()
+
+    def save(self):
+        try:
+            with open(self.path, 'w') as f:
+                json.dump(list(self.entries.items()), f, indent=2)
+        except Exception as e:
+            print(f"[x] Failed to save variable cache: {str(e)}")
+
+    def get(self, var_name, source_app, window_title, filename=None):
+        key = self.make_key(var_name, source_app, window_title, filename)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if datetime.now() - datetime.fromisoformat(entry['created']) > self.ttl:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry['value']
+
+    def put(self, var_name, source_app, window_title, value, filename=None):
+        if not value:
+            return  # Failed generations are retried next time
+        key = self.make_key(var_name, source_app, window_title, filename)
+        self.load()
+        self.entries[key] = {'value': value, 'created': datetime.now().isoformat()}
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        self.save()